@@ -0,0 +1,107 @@
+from enum import Enum
+from typing import List, Tuple
+import numpy as np
+
+MIN_CARD_LENGTH = 16
+IIN_LENGTH = 6
+CHUNK_SIZE = 100_000
+# validate_credit_card_number drops letters, dashes and spaces after strip(),
+# and int() fails on anything else that isn't a digit, interior tabs and
+# newlines included; 0 is the padding byte
+IGNORED = np.zeros(256, dtype=bool)
+IGNORED[[0, ord("-"), ord(" ")]] = True
+IGNORED[ord("a"):ord("z") + 1] = IGNORED[ord("A"):ord("Z") + 1] = True
+
+
+class CardNetwork(Enum):
+    VISA = "visa"
+    MASTERCARD = "mastercard"
+    AMEX = "amex"
+    DISCOVER = "discover"
+    JCB = "jcb"
+    DINERS = "diners"
+    UNIONPAY = "unionpay"
+    MAESTRO = "maestro"
+    UNKNOWN = "unknown"
+
+
+def _between(iin: np.ndarray, digits: np.ndarray, low: int, high: int, width: int) -> np.ndarray:
+    prefix = iin // 10 ** (IIN_LENGTH - width)
+    return (digits >= width) & (prefix >= low) & (prefix <= high)
+
+
+# first match wins, so narrower ranges come before the prefixes that contain them
+IIN_RANGES = [
+    (CardNetwork.AMEX, [(34, 34, 2), (37, 37, 2)]),
+    (CardNetwork.DINERS, [(300, 305, 3), (36, 36, 2), (38, 39, 2)]),
+    (CardNetwork.JCB, [(3528, 3589, 4)]),
+    (CardNetwork.VISA, [(4, 4, 1)]),
+    (CardNetwork.MASTERCARD, [(51, 55, 2), (222100, 272099, 6)]),
+    (CardNetwork.MAESTRO, [(50, 50, 2), (56, 58, 2), (6304, 6304, 4), (6759, 6759, 4), (6761, 6763, 4)]),
+    (CardNetwork.DISCOVER, [(6011, 6011, 4), (622126, 622925, 6), (644, 649, 3), (65, 65, 2)]),
+    (CardNetwork.UNIONPAY, [(62, 62, 2)]),
+]
+
+
+def digit_matrix(card_numbers: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # returns (digits, is_digit, malformed) where digits is a (positions x cards)
+    # uint8 matrix, so the per-card scans below run down contiguous rows, and
+    # malformed flags cards holding characters validate_credit_card_number
+    # neither strips nor accepts
+    numbers = np.array([c.strip() if isinstance(c, str) else "" for c in card_numbers], dtype=str)
+    width = max(numbers.dtype.itemsize // 4, 1)
+    points = numbers.astype(f"U{width}").view(np.uint32).reshape(len(numbers), width)
+    chars = np.minimum(points, 255).T.astype(np.uint8)
+    digits = chars - np.uint8(ord("0"))
+    is_digit = digits < 10
+    digits *= is_digit
+
+    position, card = np.nonzero(~is_digit)
+    malformed = np.zeros(len(numbers), dtype=bool)
+    malformed[card[~IGNORED[chars[position, card]]]] = True
+    return digits, is_digit, malformed
+
+
+def luhn_valid(digits: np.ndarray, is_digit: np.ndarray, malformed: np.ndarray) -> np.ndarray:
+    # doubling d and subtracting 9 when it overflows is d + d - 9 * (d >= 5)
+    from_right = np.cumsum(is_digit[::-1], axis=0, dtype=np.uint8)[::-1]
+    doubled = digits * ((from_right & 1) ^ 1)
+    total = (
+        digits.sum(axis=0, dtype=np.int32)
+        + doubled.sum(axis=0, dtype=np.int32)
+        - 9 * (doubled >= 5).sum(axis=0, dtype=np.int32)
+    )
+    return ~malformed & (is_digit.sum(axis=0) >= MIN_CARD_LENGTH) & (total % 10 == 0)
+
+
+def issuer_prefixes(digits: np.ndarray, is_digit: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the IIN sits in the first few positions, so walk rows until every card has 6 digits
+    iin = np.zeros(digits.shape[1], dtype=np.int64)
+    taken = np.zeros(digits.shape[1], dtype=np.int64)
+    for row in range(digits.shape[0]):
+        # separators leave rows with no digits for some cards, so only stop once all are full
+        if (taken >= IIN_LENGTH).all():
+            break
+        take = is_digit[row] & (taken < IIN_LENGTH)
+        iin = np.where(take, iin * 10 + digits[row], iin)
+        taken += take
+    return iin * 10 ** (IIN_LENGTH - taken), taken
+
+
+def classify_networks(iin: np.ndarray, iin_digits: np.ndarray) -> np.ndarray:
+    conditions = [
+        np.logical_or.reduce([_between(iin, iin_digits, low, high, width) for low, high, width in ranges])
+        for _, ranges in IIN_RANGES
+    ]
+    return np.select(conditions, [network.value for network, _ in IIN_RANGES], CardNetwork.UNKNOWN.value)
+
+
+def validate_cards(card_numbers: List[str], chunk_size: int = CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    valid, networks = [], []
+    for start in range(0, len(card_numbers), chunk_size):
+        digits, kept, malformed = digit_matrix(card_numbers[start:start + chunk_size])
+        valid.append(luhn_valid(digits, kept, malformed))
+        networks.append(classify_networks(*issuer_prefixes(digits, kept)))
+    if not valid:
+        return np.zeros(0, dtype=bool), np.array([], dtype=str)
+    return np.concatenate(valid), np.concatenate(networks)
@@ -0,0 +1,126 @@
+import calendar, heapq, json, os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+FREQUENCIES = ("monthly", "weekly")
+
+
+def add_months(day: date, months: int, anchor_day: int) -> date:
+    # monthly invoices stay on the original day of the month, clamped to the
+    # last day of shorter months (Jan 31 -> Feb 28/29 -> Mar 31)
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(anchor_day, calendar.monthrange(year, month + 1)[1]))
+
+
+def file_signature(filename: str) -> List[int]:
+    stat = os.stat(filename)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def next_invoice_date(last_invoiced: date, frequency: str, anchor_day: int) -> date:
+    if frequency == "monthly":
+        return add_months(last_invoiced, 1, anchor_day)
+    return last_invoiced + timedelta(days=7)
+
+
+class DueDateIndex:
+    # customers bucketed by their next invoice date, with a heap of bucket dates
+    # so a run can also pick up days that were missed; only written on save().
+    # `source` is the file_signature of the customer file the index last matched
+    def __init__(self, filename: Optional[str] = None):
+        self.filename = filename
+        self.source: Optional[List[int]] = None
+        self.customers: Dict[str, Dict[str, any]] = {}
+        self.buckets: Dict[date, List[str]] = {}
+        self._due_dates: List[date] = []
+        self._stale_dates = 0
+
+    @classmethod
+    def load(cls, filename: str) -> "DueDateIndex":
+        index = cls(filename)
+        if os.path.exists(filename):
+            with open(filename, 'r') as index_file:
+                saved = json.load(index_file)
+            index.source = saved["source"]
+            for cid, entry in saved["customers"].items():
+                index._schedule(
+                    cid, entry["frequency"], entry["anchor_day"], date.fromisoformat(entry["next_due"]),
+                    date.fromisoformat(entry["last_invoiced"]),
+                )
+        return index
+
+    def save(self, filename: Optional[str] = None) -> None:
+        filename = filename or self.filename
+        tmp_file = f"{filename}.tmp"
+        with open(tmp_file, 'w') as index_file:
+            json.dump({
+                "source": self.source,
+                "customers": {
+                    cid: {**entry, "next_due": entry["next_due"].isoformat(), "last_invoiced": entry["last_invoiced"].isoformat()}
+                    for cid, entry in self.customers.items()
+                },
+            }, index_file, indent=2)
+        os.replace(tmp_file, filename)
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self.customers
+
+    def __len__(self) -> int:
+        return len(self.customers)
+
+    def _schedule(self, cid: str, frequency: str, anchor_day: int, next_due: date, last_invoiced: date) -> None:
+        self.customers[cid] = {"frequency": frequency, "anchor_day": anchor_day, "next_due": next_due, "last_invoiced": last_invoiced}
+        if next_due not in self.buckets:
+            self.buckets[next_due] = []
+            heapq.heappush(self._due_dates, next_due)
+        self.buckets[next_due].append(cid)
+
+    def matches(self, cid: str, last_invoiced: date, frequency: str) -> bool:
+        # last_invoiced is the customer file's value, which rolling forward never changes
+        entry = self.customers.get(cid)
+        return entry is not None and entry["last_invoiced"] == last_invoiced and entry["frequency"] == frequency
+
+    def add(self, cid: str, last_invoiced: date, frequency: str) -> None:
+        self.remove(cid)
+        if frequency not in FREQUENCIES:
+            print(f"Unknown invoice frequency {frequency} for customer {cid}")
+            return
+        self._schedule(
+            cid, frequency, last_invoiced.day, next_invoice_date(last_invoiced, frequency, last_invoiced.day), last_invoiced
+        )
+
+    def remove(self, cid: str) -> None:
+        entry = self.customers.pop(cid, None)
+        if entry is None:
+            return
+        bucket = self.buckets[entry["next_due"]]
+        bucket.remove(cid)
+        if not bucket:
+            # the date stays in the heap until it is popped or the heap is rebuilt
+            del self.buckets[entry["next_due"]]
+            self._stale_dates += 1
+            if self._stale_dates > len(self.buckets):
+                self._due_dates = sorted(self.buckets)
+                self._stale_dates = 0
+
+    def due(self, on: date) -> List[str]:
+        return list(self.buckets.get(on, []))
+
+    def pop_due(self, on: date) -> List[str]:
+        # everyone due on or before `on`, each rolled forward to its first
+        # invoice date after `on`
+        due = []
+        while self._due_dates and self._due_dates[0] <= on:
+            bucket = self.buckets.pop(heapq.heappop(self._due_dates), None)
+            if bucket is None:
+                self._stale_dates = max(0, self._stale_dates - 1)
+            else:
+                due.extend(bucket)
+        for cid in due:
+            entry = self.customers[cid]
+            next_due = entry["next_due"]
+            while next_due <= on:
+                next_due = next_invoice_date(next_due, entry["frequency"], entry["anchor_day"])
+            self._schedule(cid, entry["frequency"], entry["anchor_day"], next_due, entry["last_invoiced"])
+        return due
@@ -1,8 +1,19 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
+from typing import List
+from card_batch import CardNetwork, validate_cards
+from rates import RateProvider, parse_dates
+from invoice_index import DueDateIndex, file_signature
+from revenue_shards import aggregate_revenue
+import numpy as np
 import re
 import json
 
 class CustomerProcessing():
+    def __init__(self, rates_filename: str = "conversion_rates.json", invoice_index_filename: str = "invoice_index.json"):
+        self.rate_provider = RateProvider(rates_filename)
+        self.invoice_index_filename = invoice_index_filename
+        self.invoice_index = None
+
     def validate_credit_card_number(self, card_number):
         inv_card_number = re.sub(r"[a-zA-Z- ]", "", card_number.strip())[::-1]  
         if len(inv_card_number) < 16: return False
@@ -17,6 +28,11 @@ class CustomerProcessing():
             
         print(f"Card number {card_number} is{" " if total % 10 == 0 else " not "}valid")
         return total % 10 == 0
+
+    def validate_credit_card_numbers(self, card_numbers: List[str]):
+        valid, networks = validate_cards(card_numbers)
+        print(f"{int(valid.sum())} of {len(card_numbers)} card numbers are valid")
+        return valid, networks
     
     def get_transactions(self, filename="transactions.json"):
         transactions = {}
@@ -25,28 +41,36 @@ class CustomerProcessing():
                 transactions[int(txn.pop("id"))] = txn
         return transactions
             
-    def get_currency(self, currency):
-        with open("conversion_rates.json", 'r') as conv_rates:
-            rates = json.load(conv_rates)
-            return rates.get(currency)
+    def get_currency(self, currency, on: date = None):
+        return self.rate_provider.rate(currency, on)
         
     def get_total_revenue(self):
+        txns = list(self.get_transactions().values())
+        amounts = np.array([amount if isinstance(amount, (int, float)) else 0 for amount in (txn.get("amount") for txn in txns)], dtype=np.float64)
+        currencies = np.array([txn.get("currency") or "" for txn in txns], dtype=str)
+        keep = (amounts > 0) & (currencies != "")
+        amounts, currencies, dates = amounts[keep], currencies[keep], parse_dates([txn.get("date") for txn in txns])[keep]
+
+        # one slice per currency, then one division per distinct rate in it
         revenue = 0
-        for txn in self.get_transactions().values():
-            amount = txn.get("amount")
-            if not amount or amount <= 0: continue
-            
-            currency = txn.get("currency")
-            if not currency: continue
-            
-            currency_value = self.get_currency(currency)
-            if not currency_value: continue
-            
-            revenue += amount / currency_value
+        order = np.argsort(currencies, kind="stable")
+        codes, starts = np.unique(currencies[order], return_index=True)
+        for currency, group in zip(codes.tolist(), np.split(order, starts[1:])):
+            rates = self.rate_provider.rates_for(currency, dates[group])
+            known = rates > 0
+            if not known.any(): continue
+            distinct_rates, rate_index = np.unique(rates[known], return_inverse=True)
+            totals = np.bincount(rate_index.reshape(-1), weights=amounts[group][known], minlength=len(distinct_rates))
+            revenue += float((totals / distinct_rates).sum())
             
         print(f"Total revenue found from all transactions is {revenue}")
         return revenue
     
+    def get_total_revenue_from_shards(self, filenames: List[str], workers: int = None):
+        summary = aggregate_revenue(filenames, self.rate_provider, workers)
+        print(f"Total revenue found from {summary.transactions} transactions in {len(filenames)} shards is {summary.total_cents} cents")
+        return summary
+    
     def get_invoices(self, filename="customers.json"):
         customers = {}
         with open(filename, 'r') as cust_file:
@@ -54,43 +78,101 @@ class CustomerProcessing():
                 customers[customer.pop("customer_id")] = customer
         return customers
     
+    def get_invoice_index(self, filename="customers.json") -> DueDateIndex:
+        if self.invoice_index is None:
+            self.invoice_index = DueDateIndex.load(self.invoice_index_filename)
+            # customers.json is only read again when it changed since the index was saved
+            source = file_signature(filename)
+            if self.invoice_index.source != source:
+                self._reconcile_invoice_index(filename)
+                self.invoice_index.source = source
+        return self.invoice_index
+
+    def _reconcile_invoice_index(self, filename: str):
+        # new or edited customers are rescheduled from their last invoice, and
+        # customers no longer in the file are dropped
+        invoices = self.get_invoices(filename)
+        for cid in [cid for cid in self.invoice_index.customers if cid not in invoices]:
+            self.invoice_index.remove(cid)
+        for cid, invoice in invoices.items():
+            try:
+                last_invoice = datetime.strptime(invoice["last_invoiced"], "%Y-%m-%d").date()
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping customer {cid} with invalid invoice details: {e}")
+                self.invoice_index.remove(cid)
+                continue
+            if not self.invoice_index.matches(cid, last_invoice, invoice.get("frequency")):
+                self.invoice_index.add(cid, last_invoice, invoice.get("frequency"))
+
     def invoices_to_return(self, date: datetime = datetime.today().date()):
-        customers_to_invoice = []
-        for cid, invoice in self.get_invoices().items():
-            last_invoice = datetime.strptime(invoice["last_invoiced"], "%Y-%m-%d").date()
-            
-            valid = False
-            if invoice["frequency"] == "monthly":
-                month = last_invoice.month
-                day = last_invoice.day
-                year = last_invoice.year
-                if last_invoice.month == 12 and year == date.year - 1: 
-                    month = 0
-                    year = date.year
-                if year == date.year and month + 1 == date.month and day == date.day:
-                    valid = True
-                elif last_invoice + timedelta(days=31) == date:
-                    valid = True
-                    
-                if valid:
-                    invoice["last_invoiced"] = date
-                    customers_to_invoice.append(cid)
-                    
-            elif invoice["frequency"] == "weekly":
-                print(f"Weekly invoice details: {last_invoice}, date: {date}")
-                if last_invoice + timedelta(days=7) == date:
-                    customers_to_invoice.append(cid)
-                    
+        # pops everyone due on (or, after a missed run, before) the date, rolls
+        # them to their next invoice and saves the index so they aren't due again
+        invoice_index = self.get_invoice_index()
+        customers_to_invoice = invoice_index.pop_due(date)
+        invoice_index.save()
         print(f"Customers to invoice: {", ".join(customers_to_invoice)}")
         return customers_to_invoice
 
 if __name__ == "__main__":
-    customer_processing = CustomerProcessing()
+    import os, shutil, tempfile
+    # invoices_to_return saves the index, so keep runs of this script independent
+    tmp_dir = tempfile.mkdtemp()
+    customer_processing = CustomerProcessing(invoice_index_filename=os.path.join(tmp_dir, "invoice_index.json"))
     card_numbers = ["4012 8888 8888 1881", "4539-9767-4151-2043", "4111-1111-1111-1111", "0", "4539-a790-8831-6809", "49927398716", "2222 4000 7000 0005"]
     for card_number in card_numbers:
         customer_processing.validate_credit_card_number(card_number)
+    valid, networks = customer_processing.validate_credit_card_numbers(card_numbers)
+    assert valid.tolist() == [customer_processing.validate_credit_card_number(c) for c in card_numbers]
+    # whitespace other than spaces is only stripped at the ends; the scalar path rejects it inside
+    for card_number in ["\t4111 1111 1111 1111\n", "4111\t1111 1111 1111", "4111 1111\n1111 1111"]:
+        try:
+            expected = customer_processing.validate_credit_card_number(card_number)
+        except ValueError:
+            expected = False
+        assert validate_cards([card_number])[0].tolist() == [expected]
+    assert validate_cards(["\t4111 1111 1111 1111\n"])[0].tolist() == [True]
+    # a formatted card on its own has separator rows before its IIN is complete
+    assert validate_cards(["2222 4000 7000 0005"])[1].tolist() == [CardNetwork.MASTERCARD.value]
 
     customer_processing.get_transactions()
-    customer_processing.get_total_revenue()
-    customer_processing.invoices_to_return(date=date(2025,1,1))
+    revenue = customer_processing.get_total_revenue()
+    assert customer_processing.get_total_revenue_from_shards(["transactions.json"]).total_cents == round(revenue * 100)
+    assert customer_processing.invoices_to_return(date=date(2025,1,1)) == ["cus_1", "cus_2"]
+    assert customer_processing.invoices_to_return(date=date(2025,1,8)) == ["cus_2"]
+    assert customer_processing.get_invoice_index().due(date(2025,2,1)) == ["cus_3", "cus_1"]
+
+    # the roll-forward is saved, and edits to customers.json are picked up on the next load
+    reloaded = CustomerProcessing(invoice_index_filename=customer_processing.invoice_index_filename)
+    assert reloaded.invoices_to_return(date=date(2025,1,8)) == []
+    customers_file = os.path.join(tmp_dir, "customers.json")
+    with open("customers.json", 'r') as cust_file:
+        customers = json.load(cust_file)
+    customers[1]["frequency"] = "monthly"
+    with open(customers_file, 'w') as cust_file:
+        json.dump(customers[1:], cust_file)
+    reloaded = CustomerProcessing(invoice_index_filename=customer_processing.invoice_index_filename)
+    index = reloaded.get_invoice_index(customers_file)
+    assert "cus_1" not in index and index.due(date(2025,1,25)) == ["cus_2"] and index.due(date(2025,2,1)) == ["cus_3"]
+    reloaded.invoice_index.remove("cus_2")
+    assert reloaded.invoices_to_return(date=date(2025,1,31)) == [] and len(reloaded.invoice_index._due_dates) == 1
+
+    # timestamped transactions share one subtotal per rate period
+    rates_file, shard_file = os.path.join(tmp_dir, "rates.json"), os.path.join(tmp_dir, "transactions.ndjson")
+    with open(rates_file, 'w') as conv_rates:
+        json.dump({"USD": 1, "EUR": {"2024-01-01": 0.8, "2024-02-15": 0.5}}, conv_rates)
+    with open(shard_file, 'w') as shard:
+        for i in range(1000):
+            shard.write(json.dumps({"id": i, "amount": 10, "currency": ["USD", "EUR", "GBP"][i % 3],
+                                    "date": f"2024-0{i % 3 + 1}-{i % 28 + 1:02d}T{i % 24:02d}:{i % 60:02d}:00"}) + "\n")
+        shard.write(json.dumps({"id": 1000, "amount": 8, "currency": "EUR", "date": "2023-12-31T23:59:00"}) + "\n")
+    rated = CustomerProcessing(rates_filename=rates_file)
+    summary = rated.get_total_revenue_from_shards([shard_file])
+    assert sorted(summary.subtotals, key=str) == [
+        ("EUR", "2023-12-31"), ("EUR", "2024-01-01"), ("EUR", "2024-02-15"), ("GBP", None), ("USD", "0001-01-01")
+    ]
+    assert summary.transactions == 1001 and summary.unconverted == {"EUR": 800, "GBP": 333000}
+    eur_days = [f"2024-02-{i % 28 + 1:02d}" for i in range(1, 1000, 3)]
+    eur_cents = sum(1000 / (0.5 if day >= "2024-02-15" else 0.8) for day in eur_days)
+    assert summary.total_cents == round(334 * 1000 + eur_cents)
+    shutil.rmtree(tmp_dir)
     
\ No newline at end of file
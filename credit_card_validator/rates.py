@@ -0,0 +1,76 @@
+import json, os
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+UNDATED = np.datetime64("0001-01-01", "D")
+
+
+def parse_dates(values: List[Optional[str]]) -> np.ndarray:
+    # anything missing or malformed becomes NaT, which means "latest rate"
+    try:
+        return np.array([v if isinstance(v, str) and v else "NaT" for v in values], dtype="datetime64[D]")
+    except ValueError:
+        return np.array([_parse_date(v) for v in values], dtype="datetime64[D]")
+
+
+def _parse_date(value) -> np.datetime64:
+    try:
+        return np.datetime64(value, "D")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "D")
+
+
+def period_index(days: np.ndarray, on: np.ndarray) -> np.ndarray:
+    # the rate entry in effect on each date: -1 before the first one, the latest for NaT
+    index = np.searchsorted(days, on, side="right") - 1
+    index[np.isnat(on)] = len(days) - 1
+    return index
+
+
+class RateProvider:
+    # conversion_rates.json maps a currency either to a single rate or to
+    # {"YYYY-MM-DD": rate} entries that each apply from that date on. The file
+    # is parsed once and only re-read when its mtime changes.
+    def __init__(self, filename: str = "conversion_rates.json"):
+        self.filename = filename
+        self._mtime_ns = None
+        self._rates: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _refresh(self) -> None:
+        try:
+            mtime_ns = os.stat(self.filename).st_mtime_ns
+        except OSError as e:
+            print(f"Error reading conversion rates from {self.filename}: {e}")
+            self._mtime_ns, self._rates = None, {}
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        with open(self.filename, 'r') as conv_rates:
+            raw = json.load(conv_rates)
+        rates = {}
+        for currency, value in raw.items():
+            dated = value if isinstance(value, dict) else {None: value}
+            entries = sorted((UNDATED if day is None else np.datetime64(day, "D"), rate) for day, rate in dated.items())
+            rates[currency] = (
+                np.array([day for day, _ in entries], dtype="datetime64[D]"),
+                np.array([rate if rate else np.nan for _, rate in entries], dtype=np.float64),
+            )
+        self._mtime_ns, self._rates = mtime_ns, rates
+
+    def rate(self, currency: str, on: Optional[date] = None) -> Optional[float]:
+        found = self.rates_for(currency, parse_dates([on.isoformat() if on else None]))[0]
+        return None if np.isnan(found) else float(found)
+
+    def periods(self) -> Dict[str, np.ndarray]:
+        # the start date of every rate entry per currency (UNDATED for a single rate)
+        self._refresh()
+        return {currency: days for currency, (days, _) in self._rates.items()}
+
+    def rates_for(self, currency: str, on: np.ndarray) -> np.ndarray:
+        self._refresh()
+        if currency not in self._rates:
+            return np.full(len(on), np.nan)
+        days, rates = self._rates[currency]
+        index = period_index(days, on)
+        return np.where(index >= 0, rates[np.maximum(index, 0)], np.nan)
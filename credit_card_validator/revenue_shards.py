@@ -0,0 +1,151 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from rates import RateProvider, parse_dates, period_index
+
+READ_SIZE = 1 << 20
+BATCH_SIZE = 1 << 16
+# ISO 4217 minor-unit exponents; everything else is assumed to use cents
+MINOR_UNITS = {"JPY": 0, "KRW": 0, "VND": 0, "CLP": 0, "ISK": 0, "BHD": 3, "KWD": 3, "OMR": 3, "JOD": 3, "TND": 3}
+
+SubtotalKey = Tuple[str, Optional[str]]
+
+
+def iter_transactions(path: str, read_size: int = READ_SIZE) -> Iterator[dict]:
+    # streams a JSON array (like transactions.json) or NDJSON without loading the
+    # whole file; decimals are parsed as Decimal so no float ever touches an amount
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    with open(path, 'r') as shard:
+        buffer, pos, done = "", 0, False
+        while not done:
+            chunk = shard.read(read_size)
+            done = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                try:
+                    txn, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if done:
+                        raise
+                    break
+                yield txn
+
+
+def to_minor_units(amount, currency: str) -> int:
+    exponent = MINOR_UNITS.get(currency, 2)
+    if isinstance(amount, int):
+        return amount * 10 ** exponent
+    return int((amount * 10 ** exponent).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+
+class ShardTotals:
+    # one slot per (currency, start of the rate period the transaction falls in),
+    # so the slot count follows the rate table rather than distinct timestamps
+    def __init__(self, periods: Dict[str, np.ndarray]):
+        self.periods = periods
+        self.slots: Dict[SubtotalKey, int] = {}
+        self.totals = np.zeros(16, dtype=np.int64)
+        self.counts = np.zeros(16, dtype=np.int64)
+
+    def _slot(self, key: SubtotalKey) -> int:
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.slots)
+            if slot == len(self.totals):
+                self.totals = np.concatenate([self.totals, np.zeros_like(self.totals)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        return slot
+
+    def _period_starts(self, days: np.ndarray, on: np.ndarray) -> np.ndarray:
+        # dates before the first rate have nothing to convert with; the day before it keeps them apart
+        index = period_index(days, on)
+        starts = np.where(index >= 0, days[np.maximum(index, 0)], days[0] - 1)
+        return np.datetime_as_string(starts)
+
+    def add_batch(self, txns: List[dict]) -> None:
+        currencies, days, minors = [], [], []
+        for txn in txns:
+            amount, currency = txn.get("amount"), txn.get("currency")
+            if isinstance(amount, bool) or not isinstance(amount, (int, Decimal)) or amount <= 0: continue
+            if not currency or not isinstance(currency, str): continue
+            currencies.append(currency)
+            days.append(txn.get("date"))
+            minors.append(to_minor_units(amount, currency))
+        if not minors:
+            return
+        currencies, on = np.array(currencies), parse_dates(days)
+        slots = np.empty(len(minors), dtype=np.int64)
+        for currency in np.unique(currencies).tolist():
+            rows = np.flatnonzero(currencies == currency)
+            if currency not in self.periods:
+                slots[rows] = self._slot((currency, None))
+                continue
+            starts, inverse = np.unique(self._period_starts(self.periods[currency], on[rows]), return_inverse=True)
+            slots[rows] = np.array([self._slot((currency, start)) for start in starts.tolist()])[inverse.reshape(-1)]
+        np.add.at(self.totals, slots, np.array(minors, dtype=np.int64))
+        np.add.at(self.counts, slots, 1)
+
+    def subtotals(self) -> Dict[SubtotalKey, Tuple[int, int]]:
+        return {key: (int(self.totals[slot]), int(self.counts[slot])) for key, slot in self.slots.items()}
+
+
+def total_shard(path: str, periods: Dict[str, np.ndarray]) -> Dict[SubtotalKey, Tuple[int, int]]:
+    shard_totals = ShardTotals(periods)
+    batch = []
+    for txn in iter_transactions(path):
+        batch.append(txn)
+        if len(batch) == BATCH_SIZE:
+            shard_totals.add_batch(batch)
+            batch = []
+    shard_totals.add_batch(batch)
+    return shard_totals.subtotals()
+
+
+class RevenueSummary:
+    def __init__(self, subtotals: Dict[SubtotalKey, Tuple[int, int]], rate_provider: RateProvider):
+        # subtotals stay exact integers per (currency, rate period); the only rounding
+        # is the final conversion of each subtotal into the base currency
+        self.subtotals = subtotals
+        self.by_currency: Dict[str, int] = {}
+        self.transactions = 0
+        self.unconverted: Dict[str, int] = {}
+        self.total = Decimal(0)
+        for (currency, day), (minor, count) in subtotals.items():
+            self.by_currency[currency] = self.by_currency.get(currency, 0) + minor
+            self.transactions += count
+            rate = rate_provider.rates_for(currency, parse_dates([day]))[0]
+            if not rate > 0:
+                self.unconverted[currency] = self.unconverted.get(currency, 0) + minor
+                continue
+            self.total += Decimal(minor).scaleb(-MINOR_UNITS.get(currency, 2)) / Decimal(repr(float(rate)))
+
+    @property
+    def total_cents(self) -> int:
+        return int(self.total.scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+
+def merge_subtotals(partials: List[Dict[SubtotalKey, Tuple[int, int]]]) -> Dict[SubtotalKey, Tuple[int, int]]:
+    merged = {}
+    for partial in partials:
+        for key, (minor, count) in partial.items():
+            total, seen = merged.get(key, (0, 0))
+            merged[key] = (total + minor, seen + count)
+    return merged
+
+
+def aggregate_revenue(paths: List[str], rate_provider: RateProvider, workers: Optional[int] = None) -> RevenueSummary:
+    periods = rate_provider.periods()
+    if len(paths) <= 1 or workers == 1:
+        partials = [total_shard(path, periods) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(total_shard, paths, repeat(periods)))
+    return RevenueSummary(merge_subtotals(partials), rate_provider)
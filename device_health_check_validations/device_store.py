@@ -0,0 +1,205 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import heapq
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SortKey = Tuple[int, int]
+
+
+class DeviceStore:
+    def __init__(self):
+        self.devices: Dict[str, dict] = {}
+        self.by_type: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.by_health_score: Dict[int, Dict[str, dict]] = defaultdict(dict)
+        # seqs per (device type, health score), in seq order; removals are left
+        # behind as stale seqs that scans skip until the next compaction
+        self.sorted_by_type: Dict[str, Dict[int, List[int]]] = defaultdict(dict)
+        self._stale = 0
+        self.version = 0
+        self._next_seq = 0
+        self._seqs: Dict[str, int] = {}
+        self._keys_by_seq: Dict[int, str] = {}
+        self._sort_keys: Dict[str, Tuple[str, SortKey]] = {}
+
+    @staticmethod
+    def key(device_id) -> str:
+        return str(device_id).strip()
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def __contains__(self, device_id) -> bool:
+        return self.key(device_id) in self.devices
+
+    def unsanitized(self) -> int:
+        # sanitized entries are exactly the ones with a sort key
+        return len(self.devices) - len(self._sort_keys)
+
+    def get(self, device_id) -> Optional[dict]:
+        return self.devices.get(self.key(device_id))
+
+    def _index(self, key: str, entry: dict) -> None:
+        self.by_type[entry["device_type"]][key] = entry
+        if "health_score" in entry:
+            self.by_health_score[entry["health_score"]][key] = entry
+            seq = self._seqs[key]
+            self._sort_keys[key] = (entry["device_type"], (entry["health_score"], seq))
+            seqs = self.sorted_by_type[entry["device_type"]].setdefault(entry["health_score"], [])
+            position = bisect_left(seqs, seq)
+            if position == len(seqs):
+                seqs.append(seq)
+            elif seqs[position] != seq:
+                seqs.insert(position, seq)
+
+    def _unindex(self, key: str, entry: dict) -> None:
+        self.by_type[entry["device_type"]].pop(key, None)
+        for bucket in self.by_health_score.values():
+            if bucket.pop(key, None) is not None:
+                break
+        if self._sort_keys.pop(key, None) is not None:
+            self._stale += 1
+
+    def _compact(self) -> None:
+        if self._stale <= len(self._sort_keys):
+            return
+        self.sorted_by_type = defaultdict(dict)
+        for key, (device_type, (health_score, seq)) in sorted(self._sort_keys.items(), key=lambda item: item[1][1][1]):
+            self.sorted_by_type[device_type].setdefault(health_score, []).append(seq)
+        self._stale = 0
+
+    def add(self, entry: dict) -> bool:
+        key = self.key(entry["device_id"])
+        if key in self.devices:
+            return False
+        self.devices[key] = entry
+        self._seqs[key] = self._next_seq
+        self._keys_by_seq[self._next_seq] = key
+        self._next_seq += 1
+        self._index(key, entry)
+        self.version += 1
+        return True
+
+    def remove(self, device_id) -> Optional[dict]:
+        key = self.key(device_id)
+        entry = self.devices.pop(key, None)
+        if entry is not None:
+            self._unindex(key, entry)
+            del self._keys_by_seq[self._seqs.pop(key)]
+            self._compact()
+            self.version += 1
+        return entry
+
+    def reindex(self, device_id) -> None:
+        key = self.key(device_id)
+        entry = self.devices[key]
+        self._unindex(key, entry)
+        self._index(key, entry)
+        self._compact()
+        self.version += 1
+
+    def retain(self, keep: Callable[[dict], bool]) -> int:
+        kept = {key: entry for key, entry in self.devices.items() if keep(entry)}
+        removed = len(self.devices) - len(kept)
+        device_types = list(self.by_type)
+        self.devices = kept
+        self.by_type = defaultdict(dict, {device_type: {} for device_type in device_types})
+        self.by_health_score = defaultdict(dict)
+        self.sorted_by_type = defaultdict(dict)
+        self._stale = 0
+        self._seqs = {key: self._seqs[key] for key in kept}
+        self._keys_by_seq = {seq: key for key, seq in self._seqs.items()}
+        self._sort_keys = {}
+        for key, entry in kept.items():
+            self.by_type[entry["device_type"]][key] = entry
+            if "health_score" in entry:
+                self.by_health_score[entry["health_score"]][key] = entry
+                seq = self._seqs[key]
+                self._sort_keys[key] = (entry["device_type"], (entry["health_score"], seq))
+                self.sorted_by_type[entry["device_type"]].setdefault(entry["health_score"], []).append(seq)
+        self.version += 1
+        return removed
+
+    def of_type(self, device_type: str) -> List[dict]:
+        return list(self.by_type.get(device_type, {}).values())
+
+    def with_health_score(self, health_score: int) -> List[dict]:
+        return list(self.by_health_score.get(health_score, {}).values())
+
+    def grouped_by_type(self, device_types: Optional[Iterable[str]] = None) -> Dict[str, List[dict]]:
+        device_types = self.by_type.keys() if device_types is None else device_types
+        return {device_type: self.of_type(device_type) for device_type in device_types}
+
+    def _scan_bucket(self, device_type: str, health_score: int, seqs: List[int], after_seq: int) -> Iterator[SortKey]:
+        for i in range(bisect_right(seqs, after_seq), len(seqs)):
+            sort_key = (health_score, seqs[i])
+            key = self._keys_by_seq.get(seqs[i])
+            if key is not None and self._sort_keys.get(key) == (device_type, sort_key):
+                yield sort_key
+
+    def iter_sorted(
+        self,
+        device_types: Iterable[str],
+        min_health_score: Optional[int] = None,
+        max_health_score: Optional[int] = None,
+        after: Optional[SortKey] = None,
+    ) -> Iterator[Tuple[SortKey, dict]]:
+        scans = []
+        for device_type in device_types:
+            for health_score, seqs in self.sorted_by_type.get(device_type, {}).items():
+                if min_health_score is not None and health_score < min_health_score:
+                    continue
+                if max_health_score is not None and health_score > max_health_score:
+                    continue
+                if after is not None and health_score < after[0]:
+                    continue
+                after_seq = after[1] if after is not None and health_score == after[0] else -1
+                scans.append(self._scan_bucket(device_type, health_score, seqs, after_seq))
+        for sort_key in heapq.merge(*scans):
+            yield sort_key, self.devices[self._keys_by_seq[sort_key[1]]]
+
+
+if __name__ == "__main__":
+    import itertools, random
+
+    def expected(store: DeviceStore, device_types, min_health_score=None, max_health_score=None, after=None):
+        keys = sorted(
+            (entry["health_score"], store._seqs[key])
+            for key, entry in store.devices.items()
+            if "health_score" in entry and entry["device_type"] in device_types
+            and (min_health_score is None or entry["health_score"] >= min_health_score)
+            and (max_health_score is None or entry["health_score"] <= max_health_score)
+        )
+        return [sort_key for sort_key in keys if after is None or sort_key > after]
+
+    rng = random.Random(0)
+    store = DeviceStore()
+    for step in range(3000):
+        device_id = rng.randrange(400)
+        action = rng.random()
+        if action < 0.6:
+            entry = {"device_id": device_id, "device_type": rng.choice(["SENSOR", "CAMERA"])}
+            if rng.random() < 0.8:
+                entry["health_score"] = rng.choice([-1, 0, 50, 100])
+            store.add(entry)
+        elif action < 0.85:
+            store.remove(device_id)
+        elif device_id in store and "health_score" in store.get(device_id):
+            store.get(device_id)["health_score"] = rng.choice([0, 50, 100])
+            store.reindex(device_id)
+        if step % 100 == 0:
+            store.retain(lambda entry: rng.random() < 0.95)
+
+        device_types = rng.choice([["SENSOR"], ["CAMERA"], ["SENSOR", "CAMERA"]])
+        bounds = rng.choice([(None, None), (0, None), (0, 50), (50, 100)])
+        assert [k for k, _ in store.iter_sorted(device_types, *bounds)] == expected(store, device_types, *bounds)
+
+        # walking the index page by page sees every device exactly once
+        pages, after = [], None
+        while True:
+            page = [k for k, _ in itertools.islice(store.iter_sorted(device_types, *bounds, after), 7)]
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1]
+        assert pages == expected(store, device_types, *bounds)
+    assert store._stale <= len(store._sort_keys)
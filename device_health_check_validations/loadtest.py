@@ -0,0 +1,189 @@
+import argparse, csv, json, os, random, socket, sys, tempfile, threading, time
+import urllib.error, urllib.parse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+
+ENDPOINTS = ["csv_to_json", "json_to_json", "sanitize", "result"]
+DEVICE_TYPES = ["sensor", "camera", "thermostat", "router"]
+HEALTH_STATUSES = ["healthy", "warning", "critical", "degraded"]
+
+
+def _reading(device_id: int, rng: random.Random) -> Dict[str, any]:
+    timestamp = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z"
+    return {
+        "device_id": device_id,
+        "device_name": f"Device-{device_id}",
+        "device_type": rng.choice(DEVICE_TYPES),
+        "health_status": rng.choice(HEALTH_STATUSES),
+        "timestamp": timestamp if rng.random() > 0.05 else "not-a-timestamp",
+        "temperature": str(rng.randint(-20, 120)),
+        "humidity": str(rng.randint(0, 100)),
+        "pressure": str(rng.randint(95000, 105000)),
+    }
+
+
+def generate_fleet(data_dir: str, devices: int, shards: int, seed: int = 0) -> Dict[str, List[str]]:
+    rng = random.Random(seed)
+    files = {"csv": [], "json": []}
+    per_shard = max(1, devices // shards)
+    for shard in range(shards):
+        ids = range(shard * per_shard, (shard + 1) * per_shard)
+        csv_name = f"fleet_{shard}.csv"
+        with open(os.path.join(data_dir, csv_name), "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, list(_reading(0, rng)))
+            writer.writeheader()
+            writer.writerows(_reading(device_id, rng) for device_id in ids)
+        json_name = f"fleet_{shard}.json"
+        with open(os.path.join(data_dir, json_name), "w") as json_file:
+            rows = []
+            for device_id in ids:
+                row = _reading(device_id + devices, rng)
+                row["metric_data"] = {key: row.pop(key) for key in ["temperature", "humidity", "pressure"]}
+                rows.append(row)
+            json.dump(rows, json_file)
+        files["csv"].append(csv_name)
+        files["json"].append(json_name)
+    return files
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_in_process_server(data_dir: str):
+    import uvicorn
+    os.chdir(data_dir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, thread
+
+
+def _request(base_url: str, method: str, path: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(base_url + path, method=method), timeout=300) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def _paths(endpoint: str, files: Dict[str, List[str]], requests: int) -> List[tuple]:
+    if endpoint == "csv_to_json":
+        return [("POST", "/csv_to_json?" + urllib.parse.urlencode({"filename": files["csv"][i % len(files["csv"])]})) for i in range(requests)]
+    if endpoint == "json_to_json":
+        return [("POST", "/json_to_json/" + urllib.parse.quote(files["json"][i % len(files["json"])])) for i in range(requests)]
+    if endpoint == "sanitize":
+        return [("POST", "/sanitize")] * requests
+    return [("GET", "/result")] * requests
+
+
+def run_endpoint(base_url: str, endpoint: str, files: Dict[str, List[str]], requests: int, concurrency: int) -> Dict[str, any]:
+    latencies, errors = [], 0
+
+    def call(method_path):
+        try:
+            return _request(base_url, *method_path)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"Error calling {method_path[1]}: {e}", file=sys.stderr)
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency in pool.map(call, _paths(endpoint, files, requests)):
+            if latency is None:
+                errors += 1
+            else:
+                latencies.append(latency)
+    duration = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).tolist() if latencies else (None, None, None)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else None,
+        "mean_ms": round(float(latencies_ms.mean()), 3) if latencies else None,
+        "p50_ms": round(p50, 3) if latencies else None,
+        "p95_ms": round(p95, 3) if latencies else None,
+        "p99_ms": round(p99, 3) if latencies else None,
+    }
+
+
+def find_regressions(results: Dict[str, any], baseline: Dict[str, any], tolerance: float) -> List[str]:
+    regressions = []
+    for endpoint, stats in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous or not previous.get("p95_ms") or stats["p95_ms"] is None:
+            continue
+        if stats["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {stats['p95_ms']}ms vs baseline {previous['p95_ms']}ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the device health API")
+    parser.add_argument("--devices", type=int, default=10000, help="synthetic fleet size across all shards")
+    parser.add_argument("--shards", type=int, default=4, help="number of CSV and JSON fleet files to generate")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--url", help="target a running server instead of starting one in-process; "
+                                      "it must be started from --data-dir so it can find the fleet files")
+    parser.add_argument("--data-dir", help="where fleet files are written (defaults to a temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON from a previous run to compare p95 latency against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs --baseline")
+    args = parser.parse_args(argv)
+    # the in-process server chdirs into the data dir, so pin user paths first
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="device_fleet_"))
+    os.makedirs(data_dir, exist_ok=True)
+    files = generate_fleet(data_dir, args.devices, args.shards, args.seed)
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if not base_url:
+        base_url, server, thread = start_in_process_server(data_dir)
+    try:
+        results = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")} | {"data_dir": data_dir},
+            "endpoints": {
+                endpoint: run_endpoint(base_url, endpoint, files, args.requests, args.concurrency)
+                for endpoint in args.endpoints
+            },
+        }
+    finally:
+        if server:
+            server.should_exit = True
+            thread.join()
+
+    output = json.dumps(results, indent=2)
+    if output_path:
+        with open(output_path, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,15 @@
-from collections import defaultdict
 from enum import Enum
-import re, csv, json
-from datetime import datetime
+import base64, os, re, csv, json, sys, threading, uuid
+from datetime import date, datetime
 import pytz
-from typing import Dict
-from fastapi import FastAPI, Query, Depends
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response
 import uvicorn
+from device_store import DeviceStore
+from streaming import IncrementalCsvParser, IncrementalJsonParser, ingest_stream
+from telemetry_batch import sanitize_batch
+from metric_history import MetricHistory
+from state_backend import InMemoryBackend, SharedLogBackend
 
 app = FastAPI()
 
@@ -28,38 +32,96 @@ class Health(Enum):
         return cls.__members__.get(health_status.upper(), cls.UNKNOWN)
 
 class DeviceDataProcessor:
-    def __init__(self):
-        self.jsons = defaultdict(list)
+    def __init__(self, backend=None, history: Optional[MetricHistory] = None):
+        self.store = DeviceStore()
+        # per-reading history is opt-in; every worker sharing a state log must
+        # be started with the same setting
+        self.history = history
+        self.lock = threading.RLock()
+        self.backend = backend or InMemoryBackend()
+        self._views: Dict[str, Tuple[int, any]] = {}
+        self._serialized: Dict[str, Tuple[int, str, bytes]] = {}
+
+    @property
+    def jsons(self) -> Dict[str, list]:
+        self.sync()
+        return self.store.grouped_by_type()
+
+    def _csv_row_to_entry(self, entry):
+        metric_data = {
+            "temperature": entry["temperature"],
+            "humidity": entry["humidity"],
+            "pressure": entry["pressure"]
+        }
+        for key in ["temperature", "humidity", "pressure"]:
+            del entry[key]
+        entry["metric_data"] = metric_data
+        return entry
+
+    def _commit(self, op: Dict[str, any]) -> any:
+        with self.lock:
+            return self.backend.commit(op, self._apply)
+
+    def sync(self) -> None:
+        with self.lock:
+            self.backend.sync(self._apply)
+
+    def _apply(self, op: Dict[str, any]) -> any:
+        if op["op"] == "load":
+            return self._load_entries(op["entries"], op["sanitize"])
+        if op["op"] == "sanitize":
+            return self._sanitize_and_transform(op["vectorized"])
+        raise ValueError(f"Unknown operation {op['op']}")
+
+    def _check_entry(self, entry: dict) -> dict:
+        # rejected here, before the op is applied or logged, rather than as a
+        # KeyError halfway through a load or a later sanitize
+        if not isinstance(entry, dict):
+            raise ValueError(f"Expected a device entry but got {type(entry).__name__}")
+        missing = [key for key in ("device_id", "device_type") if key not in entry]
+        if "health_score" in entry:
+            if type(entry["health_score"]) is not int:
+                raise ValueError(f"Device {entry.get('device_id')} has a non-integer health_score")
+        else:
+            missing += [key for key in ("device_name", "health_status", "timestamp", "metric_data") if key not in entry]
+            metric_data = entry.get("metric_data", {})
+            if not isinstance(metric_data, dict):
+                raise ValueError(f"Device {entry.get('device_id')} has metric_data that is not an object")
+            missing += [f"metric_data.{key}" for key in ("temperature", "humidity", "pressure") if key not in metric_data]
+        if missing:
+            raise ValueError(f"Device {entry.get('device_id')} is missing {', '.join(missing)}")
+        return entry
 
-    def _append_to_jsons_list(self, entry):
-        device_type = Device.get_device_type(entry["device_type"])
-        entry["device_type"] = device_type
-        if str(entry["device_id"]) not in map(lambda x: x["device_id"], self.jsons[device_type]):
-            self.jsons[device_type].append(entry)
+    def load_entries(self, entries: Iterable[dict], from_csv: bool = False, sanitize: bool = False) -> int:
+        entries = [self._check_entry(self._csv_row_to_entry(entry) if from_csv else entry) for entry in entries]
+        return self._commit({"op": "load", "entries": entries, "sanitize": sanitize})
+
+    def _load_entries(self, entries: List[dict], sanitize: bool) -> int:
+        for entry in entries:
+            entry["device_type"] = Device.get_device_type(entry["device_type"])
+        if self.history is not None:
+            self.history.record_batch([DeviceStore.key(entry["device_id"]) for entry in entries], entries, self._health_value)
+        if sanitize:
+            keep = self._sanitize_batch(entries)
+            entries = [entry for entry, valid in zip(entries, keep) if valid]
+        return sum(self.store.add(entry) for entry in entries)
 
     def load_csv_to_jsons(self, filename: str):
         with open(filename, 'r') as csvfile:
-            for entry in csv.DictReader(csvfile):
-                metric_data = {
-                    "temperature": entry["temperature"],
-                    "humidity": entry["humidity"],
-                    "pressure": entry["pressure"]
-                }
-                for key in ["temperature", "humidity", "pressure"]:
-                    del entry[key]
-                entry["metric_data"] = metric_data
-                self._append_to_jsons_list(entry)
+            self.load_entries(csv.DictReader(csvfile), from_csv=True)
 
     def load_json_file_to_jsons(self, json_filename):
         with open(json_filename, 'r') as jsonfile:
-            for entry in json.load(jsonfile):
-                self._append_to_jsons_list(entry)
+            self.load_entries(json.load(jsonfile))
 
     def _format_timestamp(self, timestamp: str) -> str:
         iso8601_regex = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)'
-        match = re.match(iso8601_regex, timestamp)
+        match = re.match(iso8601_regex, timestamp) if isinstance(timestamp, str) else None
         if match:
-            local_time = datetime.strptime(match[0], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.utc)
+            try:
+                local_time = datetime.strptime(match[0], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.utc)
+            except ValueError:
+                return None
             return local_time.strftime("%Y-%m-%d")
         return None
 
@@ -75,34 +137,177 @@ class DeviceDataProcessor:
     def _create_full_name(self, device_name, device_type):
         return device_name + device_type
 
-    def sanitize_and_transform(self) -> Dict[any, any]:
-        for v in self.jsons.values(): 
-            for j in v[:]:
-                valid_timestamp = self._format_timestamp(j["timestamp"])
-                if not valid_timestamp:
-                    v.remove(j)
-                    continue
-                j["timestamp"] = valid_timestamp
-                j["metric_data"]["temperature"] = self._convert_degrees(j["metric_data"]["temperature"])
-                j["metric_data"]["pressure"] = self._normalize_pressure(j["metric_data"]["pressure"])
-                j["metric_data"]["humidity"] = self._normalize_humidity(j["metric_data"]["humidity"])
-                j["health_score"] = Health.get_health_value(j["health_status"]).value
-                del j["health_status"]
-                j["device_full_name"] = self._create_full_name(j["device_name"], j["device_type"])
-        return self.jsons
+    def _sanitize_entry(self, j) -> bool:
+        if "health_score" in j:
+            return True
+        valid_timestamp = self._format_timestamp(j["timestamp"])
+        if not valid_timestamp:
+            return False
+        try:
+            temperature = self._convert_degrees(j["metric_data"]["temperature"])
+            pressure = self._normalize_pressure(j["metric_data"]["pressure"])
+            full_name = self._create_full_name(j["device_name"], j["device_type"])
+        except (TypeError, ValueError, OverflowError):
+            return False
+        j["timestamp"] = valid_timestamp
+        j["metric_data"]["temperature"] = temperature
+        j["metric_data"]["pressure"] = pressure
+        j["metric_data"]["humidity"] = self._normalize_humidity(j["metric_data"]["humidity"])
+        j["health_score"] = self._health_value(j["health_status"])
+        del j["health_status"]
+        j["device_full_name"] = full_name
+        return True
+
+    def _health_value(self, health_status: str) -> int:
+        if not isinstance(health_status, str):
+            return Health.UNKNOWN.value
+        return Health.get_health_value(health_status).value
+
+    def _sanitize_batch(self, entries: List[dict]):
+        return sanitize_batch(entries, self._health_value)
+
+    def sanitize_and_transform(self, vectorized: bool = True) -> Dict[any, any]:
+        with self.lock:
+            self.sync()
+            # a poll with nothing left to sanitize commits nothing, so it
+            # neither takes the log lock nor grows the log
+            if self.store.unsanitized():
+                self._commit({"op": "sanitize", "vectorized": vectorized})
+            return self.store.grouped_by_type()
+
+    def _sanitize_and_transform(self, vectorized: bool) -> None:
+        if not vectorized:
+            self.store.retain(self._sanitize_entry)
+            return
+        pending = [entry for entry in self.store.devices.values() if "health_score" not in entry]
+        if pending:
+            invalid = {id(entry) for entry, valid in zip(pending, self._sanitize_batch(pending)) if not valid}
+            self.store.retain(lambda entry: id(entry) not in invalid)
 
     def sort_and_filter_data(self):
+        with self.lock:
+            self.sync()
+            return self._cached_view("result", self._sort_and_filter_data)
+
+    def _cached_view(self, name: str, build: Callable[[], any]):
+        version = self.store.version
+        cached = self._views.get(name)
+        if cached is None or cached[0] != version:
+            cached = self._views[name] = (version, build())
+        return cached[1]
+
+    def _cached_bytes(self, name: str, build: Callable[[], any]) -> Tuple[str, bytes]:
+        version = self.store.version
+        cached = self._serialized.get(name)
+        if cached is None or cached[0] != version:
+            body = json.dumps(self._cached_view(name, build), indent=2).encode()
+            cached = self._serialized[name] = (version, f'"{self.backend.epoch}-{version}"', body)
+        return cached[1], cached[2]
+
+    def serialized_sanitized(self) -> Tuple[str, bytes]:
+        with self.lock:
+            self.sanitize_and_transform()
+            return self._cached_bytes("sanitize", self.store.grouped_by_type)
+
+    def serialized_result(self) -> Tuple[str, bytes]:
+        with self.lock:
+            self.sync()
+            return self._cached_bytes("result", self._sort_and_filter_data)
+
+    def _sort_and_filter_data(self):
         return {
-            k: sorted(
-                [entry for entry in v if entry["health_score"] != -1],
-                key=lambda x: x["health_score"]
-            )
-            for k, v in self.jsons.items() 
+            k: [entry for _, entry in self.store.iter_sorted([k], min_health_score=Health.CRITICAL.value)]
+            for k in self.store.by_type
             if k != Device.UNKNOWN.name
         }
 
+    def _encode_cursor(self, sort_key) -> str:
+        return base64.urlsafe_b64encode(f"{sort_key[0]}:{sort_key[1]}".encode()).decode()
+
+    def _decode_cursor(self, cursor: str):
+        try:
+            health_score, seq = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            return int(health_score), int(seq)
+        except ValueError:
+            raise ValueError(f"Invalid cursor {cursor}")
+
+    def query(
+        self,
+        device_type: Optional[str] = None,
+        min_health_score: int = Health.CRITICAL.value,
+        max_health_score: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, any]:
+        after = self._decode_cursor(cursor) if cursor else None
+        devices, last_key, has_more = [], None, False
+        with self.lock:
+            # after sync so types another worker added to the shared log are included
+            self.sync()
+            device_types = [device_type] if device_type else [k for k in self.store.by_type if k != Device.UNKNOWN.name]
+            for sort_key, entry in self.store.iter_sorted(device_types, min_health_score, max_health_score, after):
+                if (start_date and entry["timestamp"] < start_date) or (end_date and entry["timestamp"] > end_date):
+                    continue
+                if len(devices) == limit:
+                    has_more = True
+                    break
+                devices.append(entry)
+                last_key = sort_key
+        return {"devices": devices, "next_cursor": self._encode_cursor(last_key) if has_more else None}
+
+    def device_history(self, device_id, resolution: str = "1m", limit: Optional[int] = None) -> Optional[Dict[str, any]]:
+        with self.lock:
+            self.sync()
+            key = DeviceStore.key(device_id)
+            if self.history is None or key not in self.history:
+                return None
+            if resolution == "raw":
+                return {"device_id": device_id, "resolution": resolution, "readings": self.history.latest(key, limit)}
+            return {"device_id": device_id, "resolution": resolution, "rollups": self.history.summary(key, resolution, limit)}
 
-processor = DeviceDataProcessor()
+
+def create_processor() -> DeviceDataProcessor:
+    state_log = os.environ.get("DEVICE_STATE_LOG")
+    history = MetricHistory() if os.environ.get("DEVICE_HISTORY", "").lower() in ("1", "true", "yes") else None
+    return DeviceDataProcessor(SharedLogBackend(state_log) if state_log else None, history)
+
+
+processor = create_processor()
+uploads: Dict[str, Dict[str, any]] = {}
+MAX_TRACKED_UPLOADS = 1000
+
+async def _ingest_upload(request: Request, parser, from_csv: bool, upload_id: Optional[str], sanitize: bool, batch_size: int):
+    upload_id = upload_id or uuid.uuid4().hex
+    progress = uploads[upload_id] = {
+        "upload_id": upload_id, "status": "receiving", "received_bytes": 0, "records": 0, "loaded": 0, "batches": 0
+    }
+    while len(uploads) > MAX_TRACKED_UPLOADS:
+        uploads.pop(next(iter(uploads)))
+    apply_batch = lambda batch: processor.load_entries(batch, from_csv=from_csv, sanitize=sanitize)
+    # each batch is committed as soon as it is parsed, so a failed upload keeps
+    # every batch before the bad record; the 400 detail reports how many were
+    # loaded so the client can resend only the rest
+    try:
+        await ingest_stream(request.stream(), parser, apply_batch, progress, batch_size)
+    except (ValueError, KeyError) as e:
+        progress["status"] = "failed"
+        raise HTTPException(status_code=400, detail={**progress, "error": str(e)})
+    progress["status"] = "loaded"
+    return progress
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _cached_json_response(request: Request, etag: str, body: bytes) -> Response:
+    # If-None-Match only short-circuits safe methods; a POST always gets the body
+    if request.method in ("GET", "HEAD") and _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.get("/")
 async def root():
@@ -118,13 +323,232 @@ def load_json_to_json(filename: str):
     processor.load_json_file_to_jsons(filename)
     return {"status": "json loaded"}
 
+@app.post("/upload/csv")
+async def upload_csv(request: Request, upload_id: Optional[str] = None, sanitize: bool = False, batch_size: int = Query(1000, ge=1, le=100000)):
+    return await _ingest_upload(request, IncrementalCsvParser(), True, upload_id, sanitize, batch_size)
+
+@app.post("/upload/json")
+async def upload_json(request: Request, upload_id: Optional[str] = None, sanitize: bool = False, batch_size: int = Query(1000, ge=1, le=100000)):
+    return await _ingest_upload(request, IncrementalJsonParser(), False, upload_id, sanitize, batch_size)
+
+@app.get("/upload/{upload_id}")
+async def upload_progress(upload_id: str):
+    if upload_id not in uploads:
+        raise HTTPException(status_code=404, detail=f"Upload {upload_id} not found")
+    return uploads[upload_id]
+
 @app.post("/sanitize")
-def sanitize_data():
-    return json.dumps(processor.sanitize_and_transform(), indent=2)
+def sanitize_data(request: Request):
+    return _cached_json_response(request, *processor.serialized_sanitized())
+
+@app.api_route("/result", methods=["GET", "HEAD"])
+def get_sorted_filtered_data(request: Request):
+    return _cached_json_response(request, *processor.serialized_result())
+
+@app.get("/devices")
+def query_devices(
+    device_type: Optional[str] = None,
+    min_health_score: int = Health.CRITICAL.value,
+    max_health_score: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    if device_type:
+        device_type = Device.get_device_type(device_type.lower())
+    try:
+        return processor.query(
+            device_type,
+            min_health_score,
+            max_health_score,
+            start_date.isoformat() if start_date else None,
+            end_date.isoformat() if end_date else None,
+            limit,
+            cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/devices/{device_id}/history")
+def get_device_history(device_id: str, resolution: str = Query("1m", pattern="^(raw|1m|1h)$"), limit: Optional[int] = Query(None, ge=1)):
+    if processor.history is None:
+        raise HTTPException(status_code=404, detail="Metric history is disabled; start the server with DEVICE_HISTORY=1")
+    history = processor.device_history(device_id, resolution, limit)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"No readings recorded for device {device_id}")
+    return history
+
+class TestClass:
+    def __init__(self):
+        from fastapi.testclient import TestClient
+        self.client = TestClient(app)
+
+    def _reset(self, processor_: Optional[DeviceDataProcessor] = None) -> DeviceDataProcessor:
+        global processor
+        processor = processor_ or DeviceDataProcessor()
+        uploads.clear()
+        return processor
+
+    def _reading(self, device_id: int, **overrides) -> Dict[str, any]:
+        return {
+            "device_id": device_id, "device_name": f"Device-{device_id}", "device_type": "sensor",
+            "health_status": "healthy", "timestamp": "2024-04-08T10:00:00Z",
+            "metric_data": {"temperature": "212", "humidity": "45", "pressure": "101325"},
+            **overrides,
+        }
+
+    def test_failed_upload_keeps_applied_batches(self):
+        test_processor = self._reset()
+        body = "\n".join(json.dumps(self._reading(i)) for i in range(5)) + '\n{"device_id": '
+        response = self.client.post("/upload/json?upload_id=bad&batch_size=2", content=body)
+        assert response.status_code == 400
+        detail = response.json()["detail"]
+        assert detail["status"] == "failed" and detail["loaded"] == 4 and detail["batches"] == 2
+        assert len(test_processor.store) == 4
+        assert self.client.get("/upload/bad").json()["status"] == "failed"
+
+        csv_body = "device_id,device_name,device_type,health_status,timestamp,temperature,humidity,pressure\n"
+        csv_body += "".join(f'{i},"Device, {i}",camera,warning,2024-04-08T10:00:00Z,32,50,100000\n' for i in range(10, 13))
+        response = self.client.post("/upload/csv?sanitize=true&batch_size=2", content=csv_body)
+        assert response.status_code == 200 and response.json()["loaded"] == 3
+        assert test_processor.store.get(10)["device_full_name"] == "Device, 10CAMERA"
+
+
+    def test_sanitize_parity_on_mixed_types(self):
+        readings = [
+            self._reading(1, metric_data={"temperature": 72.5, "humidity": 45, "pressure": "101325"}),
+            self._reading(2, metric_data={"temperature": "70", "humidity": 45.5, "pressure": 100000.9}),
+            self._reading(3, metric_data={"temperature": True, "humidity": "50", "pressure": 99000}),
+            self._reading(4, metric_data={"temperature": "72.5", "humidity": 40, "pressure": 100000}),
+            self._reading(5, metric_data={"temperature": None, "humidity": 40, "pressure": 100000}),
+            self._reading(6, device_name=7),
+            self._reading(7, health_status=None, timestamp=20240408),
+            self._reading(8, health_status=None),
+            self._reading(9, health_status="WARNING", timestamp="2024-02-30T10:00:00Z"),
+        ]
+        results = []
+        for vectorized in (False, True):
+            test_processor = DeviceDataProcessor()
+            test_processor.load_entries(json.loads(json.dumps(readings)))
+            results.append(test_processor.sanitize_and_transform(vectorized=vectorized))
+        assert results[0] == results[1]
+        sanitized = {entry["device_id"]: entry for entry in results[1]["SENSOR"]}
+        assert sorted(sanitized) == [1, 2, 3, 8]
+        assert sanitized[1]["metric_data"] == {"temperature": 22.22, "humidity": "45%", "pressure": 1013.25}
+        assert sanitized[2]["metric_data"] == {"temperature": 21.11, "humidity": "45.5%", "pressure": 1000.0}
+        assert sanitized[3]["metric_data"] == {"temperature": -17.22, "humidity": "50%", "pressure": 990.0}
+        assert sanitized[8]["health_score"] == Health.UNKNOWN.value
+
+
+    def test_conditional_requests(self):
+        self._reset().load_entries([self._reading(1), self._reading(2, health_status="warning")])
+        sanitized = self.client.post("/sanitize")
+        etag = sanitized.headers["etag"]
+        assert sanitized.status_code == 200 and len(sanitized.json()["SENSOR"]) == 2
+        repeated = self.client.post("/sanitize", headers={"If-None-Match": etag})
+        assert repeated.status_code == 200 and repeated.json() == sanitized.json()
+
+        result = self.client.get("/result")
+        assert [entry["device_id"] for entry in result.json()["SENSOR"]] == [2, 1]
+        assert self.client.get("/result", headers={"If-None-Match": result.headers["etag"]}).status_code == 304
+        head = self.client.head("/result", headers={"If-None-Match": result.headers["etag"]})
+        assert head.status_code == 304 and head.headers["etag"] == result.headers["etag"]
+        head = self.client.head("/result")
+        assert head.status_code == 200 and head.headers["etag"] == result.headers["etag"]
+        processor.load_entries([self._reading(3, health_status="critical")])
+        changed = self.client.get("/result", headers={"If-None-Match": result.headers["etag"]})
+        assert changed.status_code == 200 and changed.headers["etag"] != result.headers["etag"]
+
+
+    def test_device_query_pagination(self):
+        test_processor = self._reset()
+        statuses = ["healthy", "warning", "critical", "unknown"]
+        test_processor.load_entries([
+            self._reading(i, device_type=["sensor", "camera"][i % 2], health_status=statuses[i % 4], timestamp=f"2024-04-{i % 28 + 1:02d}T10:00:00Z")
+            for i in range(40)
+        ], sanitize=True)
+
+        seen, cursor = [], None
+        while True:
+            page = self.client.get("/devices", params={"limit": 6, **({"cursor": cursor} if cursor else {})}).json()
+            seen.extend((entry["health_score"], entry["device_id"]) for entry in page["devices"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == sorted((entry["health_score"], entry["device_id"]) for entries in test_processor.jsons.values() for entry in entries if entry["health_score"] >= 0)
+
+        page = self.client.get("/devices", params={"device_type": "camera", "min_health_score": 50, "start_date": "2024-04-10", "limit": 100}).json()
+        assert page["next_cursor"] is None and page["devices"]
+        assert all(entry["device_type"] == "CAMERA" and entry["health_score"] >= 50 and entry["timestamp"] >= "2024-04-10" for entry in page["devices"])
+        assert self.client.get("/devices", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+    def test_device_history(self):
+        self._reset().load_entries([self._reading(1)])
+        assert self.client.get("/devices/1/history").status_code == 404
+
+        test_processor = self._reset(DeviceDataProcessor(history=MetricHistory(capacity=3, minute_buckets=2)))
+        test_processor.load_entries([
+            self._reading(1, timestamp=f"2024-04-08T10:0{minute}:{second}0Z", metric_data={"temperature": "212", "humidity": "40", "pressure": str(100000 + minute)})
+            for minute in range(3) for second in range(2)
+        ] + [self._reading(2, timestamp="not-a-timestamp")])
+        raw = self.client.get("/devices/1/history", params={"resolution": "raw"}).json()["readings"]
+        assert [reading["timestamp"] % 60 for reading in raw] == [10, 0, 10] and raw[0]["temperature"] == 100.0
+        rollups = self.client.get("/devices/1/history").json()["rollups"]
+        assert [rollup["count"] for rollup in rollups] == [2, 2]
+        assert rollups[-1]["pressure"] == {"min": 1000.02, "max": 1000.02, "mean": 1000.02}
+        assert self.client.get("/devices/1/history", params={"resolution": "1h"}).json()["rollups"][0]["count"] == 6
+        assert self.client.get("/devices/2/history").status_code == 404
+
+
+    def test_shared_log(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "device_state.log")
+            first = self._reset(DeviceDataProcessor(SharedLogBackend(path)))
+            second = DeviceDataProcessor(SharedLogBackend(path))
+            first.load_entries([self._reading(1), self._reading(2, health_status="critical")])
+            second.load_entries([self._reading(3, device_type="camera")], sanitize=True)
+            assert second.sanitize_and_transform() == first.sanitize_and_transform()
+            assert len(second.store) == 3 and second.store.unsanitized() == 0
+
+            with open(path, "rb") as log:
+                lines = log.read().count(b"\n")
+            for _ in range(20):
+                assert self.client.post("/sanitize").status_code == 200
+            with open(path, "rb") as log:
+                assert log.read().count(b"\n") == lines
+
+            # a worker's first query already sees a device type another worker just added
+            third = DeviceDataProcessor(SharedLogBackend(path))
+            first.load_entries([self._reading(6, device_type="thermostat")], sanitize=True)
+            assert 6 in [entry["device_id"] for entry in third.query()["devices"]]
+            with open(path, "rb") as log:
+                lines = log.read().count(b"\n")
+
+            try:
+                first.load_entries([self._reading(4), {"device_id": 5, "device_type": "sensor"}])
+                assert False, "expected ValueError"
+            except ValueError as e:
+                assert "metric_data" in str(e)
+            with open(path, "rb") as log:
+                assert log.read().count(b"\n") == lines
+            second.sync()
+            assert 4 not in first.store and 4 not in second.store
+            assert len(DeviceDataProcessor(SharedLogBackend(path)).jsons["SENSOR"]) == 2
 
-@app.get("/result")
-def get_sorted_filtered_data():
-    return json.dumps(processor.sort_and_filter_data(), indent=2)
 
-if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+if __name__ == "__main__" and sys.argv[1:] == ["test"]:
+    test_class = TestClass()
+    test_class.test_failed_upload_keeps_applied_batches()
+    test_class.test_sanitize_parity_on_mixed_types()
+    test_class.test_conditional_requests()
+    test_class.test_device_query_pagination()
+    test_class.test_device_history()
+    test_class.test_shared_log()
+elif __name__ == "__main__":
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        os.environ.setdefault("DEVICE_STATE_LOG", "device_state.log")
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=workers == 1, workers=workers)
@@ -0,0 +1,225 @@
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from telemetry_batch import epoch_seconds, health_scores, to_float
+
+METRICS = ("temperature", "humidity", "pressure", "health_score")
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+RUN_FANOUT = 4
+
+Columns = Dict[str, np.ndarray]
+
+
+def _group_starts(keys: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+
+
+class DeviceTable:
+    # rows for every device in shared NumPy columns, kept as a few runs sorted by
+    # device, oldest first. Each batch is sorted and reduced (capped or rolled up)
+    # as it is appended and again whenever runs merge, so there are O(log n) runs
+    # and a query binary-searches each one for its device's rows only
+    def __init__(self, columns: Dict[str, tuple]):
+        self.runs: List[Columns] = [{name: np.zeros((0, *shape), dtype=dtype) for name, (dtype, shape) in columns.items()}]
+
+    def __len__(self) -> int:
+        return sum(len(run["device"]) for run in self.runs)
+
+    def append(self, batch: Columns) -> None:
+        self.runs.append(self._sorted(batch))
+        # merge the newest RUN_FANOUT runs once the oldest of them is no bigger than
+        # the rest together, so each row is re-sorted about log_RUN_FANOUT(n) times
+        while len(self.runs) > RUN_FANOUT and self._size(-RUN_FANOUT) <= sum(map(self._size, range(1 - RUN_FANOUT, 0))):
+            merged = self._merged(self.runs[-RUN_FANOUT:])
+            self.runs[-RUN_FANOUT:] = [merged]
+
+    def compact(self) -> None:
+        self.runs = [self._merged(self.runs)]
+
+    def rows(self, device: int) -> Columns:
+        # the device's rows in arrival order: its slice of each run, oldest run first
+        bounds = [np.searchsorted(run["device"], [device, device + 1]) for run in self.runs]
+        return {
+            name: np.concatenate([run[name][lo:hi] for run, (lo, hi) in zip(self.runs, bounds)])
+            for name in self.runs[0]
+        }
+
+    def _size(self, run: int) -> int:
+        return len(self.runs[run]["device"])
+
+    def _merged(self, runs: List[Columns]) -> Columns:
+        return self._sorted({name: np.concatenate([run[name] for run in runs]) for name in runs[0]})
+
+    def _sorted(self, rows: Columns) -> Columns:
+        order = self._order(rows)
+        return self._reduce({name: column[order] for name, column in rows.items()})
+
+    def _order(self, rows: Columns) -> np.ndarray:
+        return np.argsort(rows["device"], kind="stable")
+
+    def _reduce(self, rows: Columns) -> Columns:
+        return rows
+
+
+class RawReadings(DeviceTable):
+    def __init__(self, capacity: int):
+        super().__init__({"device": (np.int32, ()), "timestamp": (np.int64, ()), "values": (np.float32, (len(METRICS),))})
+        self.capacity = capacity
+
+    def _reduce(self, rows: Columns) -> Columns:
+        # keep the newest `capacity` readings of each device
+        starts = _group_starts(rows["device"])
+        sizes = np.diff(np.r_[starts, len(rows["device"])])
+        remaining = np.repeat(starts + sizes, sizes) - np.arange(len(rows["device"]))
+        keep = remaining <= self.capacity
+        return {name: column[keep] for name, column in rows.items()}
+
+    def latest(self, device: int, limit: Optional[int] = None) -> List[Dict[str, any]]:
+        rows = self.rows(device)
+        timestamps, values = rows["timestamp"][-self.capacity:], rows["values"][-self.capacity:]
+        if limit:
+            timestamps, values = timestamps[-limit:], values[-limit:]
+        return [
+            {"timestamp": timestamp, **{metric: round(float(value), 2) for metric, value in zip(METRICS, reading)}}
+            for timestamp, reading in zip(timestamps.tolist(), values.tolist())
+        ]
+
+
+class Rollups(DeviceTable):
+    # count/min/max/sum per (device, bucket), merged as each batch is appended
+    # and again as runs merge, trimmed to the `buckets` most recent buckets
+    # before each device's latest one
+    def __init__(self, seconds: int, buckets: int):
+        super().__init__({
+            "device": (np.int32, ()), "bucket": (np.int64, ()), "count": (np.int64, ()),
+            "min": (np.float32, (len(METRICS),)), "max": (np.float32, (len(METRICS),)), "sum": (np.float64, (len(METRICS),)),
+        })
+        self.seconds = seconds
+        self.buckets = buckets
+
+    def add(self, devices: np.ndarray, timestamps: np.ndarray, values: np.ndarray) -> None:
+        self.append({
+            "device": devices, "bucket": timestamps // self.seconds, "count": np.ones(len(devices), dtype=np.int64),
+            "min": values.astype(np.float32), "max": values.astype(np.float32), "sum": values,
+        })
+
+    def _order(self, rows: Columns) -> np.ndarray:
+        if not len(rows["device"]):
+            return np.zeros(0, dtype=np.int64)
+        # one int64 key when (device, bucket) fits, so merging already sorted runs
+        # takes the stable sort's fast path instead of a full lexsort
+        low, span = rows["bucket"].min(), int(rows["bucket"].max() - rows["bucket"].min()) + 1
+        if (int(rows["device"].max()) + 1) * span >= 1 << 62:
+            return np.lexsort((rows["bucket"], rows["device"]))
+        return np.argsort(rows["device"].astype(np.int64) * span + (rows["bucket"] - low), kind="stable")
+
+    def _reduce(self, rows: Columns) -> Columns:
+        if not len(rows["device"]):
+            return rows
+        device_changes = np.r_[True, rows["device"][1:] != rows["device"][:-1]]
+        starts = np.flatnonzero(device_changes | np.r_[True, rows["bucket"][1:] != rows["bucket"][:-1]])
+        merged = {
+            "device": rows["device"][starts], "bucket": rows["bucket"][starts],
+            "count": np.add.reduceat(rows["count"], starts), "min": np.minimum.reduceat(rows["min"], starts),
+            "max": np.maximum.reduceat(rows["max"], starts), "sum": np.add.reduceat(rows["sum"], starts),
+        }
+        # buckets are ascending within a device, so its last row holds the latest bucket
+        device_starts = _group_starts(merged["device"])
+        sizes = np.diff(np.r_[device_starts, len(merged["device"])])
+        latest = np.repeat(merged["bucket"][np.r_[device_starts[1:], len(merged["device"])] - 1], sizes)
+        keep = merged["bucket"] > latest - self.buckets
+        return {name: column[keep] for name, column in merged.items()}
+
+    def summary(self, device: int, limit: Optional[int] = None) -> List[Dict[str, any]]:
+        rows = self._sorted(self.rows(device))
+        if limit:
+            rows = {name: column[-limit:] for name, column in rows.items()}
+        means = rows["sum"] / rows["count"][:, None]
+        return [
+            {
+                "start": bucket * self.seconds,
+                "count": count,
+                **{
+                    metric: {"min": round(float(low), 2), "max": round(float(high), 2), "mean": round(float(mean), 2)}
+                    for metric, low, high, mean in zip(METRICS, lows, highs, row_means)
+                },
+            }
+            for bucket, count, lows, highs, row_means in zip(
+                rows["bucket"].tolist(), rows["count"].tolist(), rows["min"].tolist(), rows["max"].tolist(), means.tolist()
+            )
+        ]
+
+
+class MetricHistory:
+    def __init__(self, capacity: int = 64, minute_buckets: int = 60, hour_buckets: int = 48):
+        self.devices: Dict[str, int] = {}
+        self.raw = RawReadings(capacity)
+        self.rollups = {"1m": Rollups(RESOLUTIONS["1m"], minute_buckets), "1h": Rollups(RESOLUTIONS["1h"], hour_buckets)}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.devices
+
+    def latest(self, key: str, limit: Optional[int] = None) -> Optional[List[Dict[str, any]]]:
+        device = self.devices.get(key)
+        return None if device is None else self.raw.latest(device, limit)
+
+    def summary(self, key: str, resolution: str, limit: Optional[int] = None) -> Optional[List[Dict[str, any]]]:
+        device = self.devices.get(key)
+        return None if device is None else self.rollups[resolution].summary(device, limit)
+
+    def record_batch(self, keys: List[str], entries: List[dict], get_health_value: Callable[[str], int]) -> int:
+        if not entries:
+            return 0
+        metrics = [e.get("metric_data") or {} for e in entries]
+        valid, timestamps = epoch_seconds([e.get("timestamp") for e in entries])
+        # readings are kept in the units sanitize_and_transform reports: C, %, hPa
+        values = np.column_stack([
+            (to_float([m.get("temperature") for m in metrics]) - 32) * 5 / 9,
+            to_float([m.get("humidity") for m in metrics]),
+            to_float([m.get("pressure") for m in metrics]) / 100,
+            health_scores([e.get("health_status") for e in entries], get_health_value),
+        ])
+        valid &= ~np.isnan(values).any(axis=1)
+        rows = np.flatnonzero(valid)
+        if not len(rows):
+            return 0
+
+        # the whole batch goes into the shared columns at once; only the key to
+        # device-number lookup is per reading
+        devices = np.fromiter(
+            (self.devices.setdefault(keys[i], len(self.devices)) for i in rows.tolist()), dtype=np.int32, count=len(rows)
+        )
+        timestamps, values = timestamps[rows], values[rows]
+        self.raw.append({"device": devices, "timestamp": timestamps, "values": values.astype(np.float32)})
+        for rollups in self.rollups.values():
+            rollups.add(devices, timestamps, values)
+        return len(rows)
+
+
+if __name__ == "__main__":
+    history = MetricHistory(capacity=4, minute_buckets=3, hour_buckets=2)
+    health = {"healthy": 100, "warning": 50}.get
+    for batch in range(10):
+        entries = [
+            {"health_status": "healthy" if i % 2 else "warning", "timestamp": f"2024-04-08T1{batch % 3}:{batch + i:02d}:00Z",
+             "metric_data": {"temperature": str(32 + i), "humidity": i, "pressure": 100000}}
+            for i in range(6)
+        ]
+        assert history.record_batch([str(i % 3) for i in range(6)], entries, health) == 6
+    before = {key: (history.latest(key), history.summary(key, "1m"), history.summary(key, "1h")) for key in "012"}
+    for table in [history.raw, *history.rollups.values()]:
+        table.compact()
+    assert {key: (history.latest(key), history.summary(key, "1m"), history.summary(key, "1h")) for key in "012"} == before
+    assert len(history.raw) == 3 * 4 and len(history.rollups["1m"]) <= 3 * 3 and len(history.rollups["1h"]) <= 3 * 2
+    assert [reading["humidity"] for reading in history.latest("1")] == [1, 4, 1, 4]
+    assert [(rollup["start"] % 86400 // 3600, rollup["count"]) for rollup in history.summary("0", "1h")] == [(11, 6), (12, 6)]
+    assert history.latest("3") is None and history.record_batch([], [], health) == 0
+
+    # a batch adds one rollup row per device and bucket, and runs stay logarithmic
+    history = MetricHistory(capacity=4)
+    reading = {"health_status": "healthy", "timestamp": "2024-04-08T10:00:00Z", "metric_data": {"temperature": 50, "humidity": 1, "pressure": 1}}
+    assert history.record_batch(["a"] * 10, [reading] * 10, health) == 10
+    assert len(history.rollups["1m"]) == 1 and len(history.raw) == 4
+    for device in range(4096):
+        history.record_batch([str(device)], [reading], health)
+    assert len(history.raw.runs) <= 1 + (RUN_FANOUT - 1) * 7 and len(history.raw) == 4 + 4096
+    assert history.summary("a", "1m")[0]["count"] == 10 and len(history.latest("4095")) == 1
@@ -0,0 +1,116 @@
+import fcntl, json, os, uuid
+from typing import Callable, Dict
+
+Apply = Callable[[Dict[str, any]], any]
+
+
+class InMemoryBackend:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def commit(self, op: Dict[str, any], apply: Apply) -> any:
+        return apply(op)
+
+    def sync(self, apply: Apply) -> int:
+        return 0
+
+
+# Every worker replays the same append-only NDJSON op log into its own
+# DeviceDataProcessor. Writers serialize on an exclusive flock, readers only
+# tail whole lines past their offset and never take the lock.
+class SharedLogBackend:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "ab"):
+            pass
+        stat = os.stat(path)
+        self.epoch = f"{stat.st_dev:x}{stat.st_ino:x}"
+        self.offset = 0
+
+    def sync(self, apply: Apply) -> int:
+        if os.path.getsize(self.path) <= self.offset:
+            return 0
+        with open(self.path, "rb") as log:
+            log.seek(self.offset)
+            data = log.read()
+        end = data.rfind(b"\n") + 1
+        applied = 0
+        for line in data[:end].splitlines(keepends=True):
+            # ops are only logged after they applied cleanly in the writer, so a
+            # replay failure means this worker can no longer match the others
+            try:
+                apply(json.loads(line))
+            except Exception as e:
+                raise RuntimeError(f"Error replaying operation at byte {self.offset} of {self.path}: {e}") from e
+            self.offset += len(line)
+            applied += 1
+        return applied
+
+    def commit(self, op: Dict[str, any], apply: Apply) -> any:
+        # the op is applied under the lock first and only appended once it
+        # succeeded, so an op that raises never reaches the other workers
+        line = json.dumps(op).encode() + b"\n"
+        with open(self.path, "ab") as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                self.sync(apply)
+                result = apply(op)
+                log.write(line)
+                log.flush()
+                self.offset += len(line)
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+        return result
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    def applier(state: list) -> Apply:
+        def apply(op):
+            if op.get("fail"):
+                raise ValueError("rejected")
+            state.append(op["value"])
+            return len(state)
+        return apply
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "state.log")
+        first_state, second_state = [], []
+        first, second = SharedLogBackend(path), SharedLogBackend(path)
+        assert first.epoch == second.epoch
+
+        assert first.commit({"value": 1}, applier(first_state)) == 1
+        assert second.commit({"value": 2}, applier(second_state)) == 2
+        assert second_state == [1, 2] and first.sync(applier(first_state)) == 1 and first_state == [1, 2]
+
+        size = os.path.getsize(path)
+        try:
+            first.commit({"value": 3, "fail": True}, applier(first_state))
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert os.path.getsize(path) == size and second.sync(applier(second_state)) == 0
+
+        late_state = []
+        assert SharedLogBackend(path).sync(applier(late_state)) == 2 and late_state == [1, 2]
+
+        # a torn final line waits until the writer finishes it
+        with open(path, "ab") as log:
+            log.write(b'{"value": 6')
+        assert second.sync(applier(second_state)) == 0
+        with open(path, "ab") as log:
+            log.write(b'}\n')
+        assert second.sync(applier(second_state)) == 1 and second_state == [1, 2, 6]
+
+        # a logged op that no longer replays stops the worker instead of being skipped
+        size = os.path.getsize(path)
+        with open(path, "ab") as log:
+            log.write(json.dumps({"value": 4, "fail": True}).encode() + b"\n" + json.dumps({"value": 5}).encode() + b"\n")
+        for _ in range(2):
+            try:
+                second.sync(applier(second_state))
+                assert False, "expected RuntimeError"
+            except RuntimeError as e:
+                assert "rejected" in str(e)
+        assert second_state == [1, 2, 6] and second.offset == size
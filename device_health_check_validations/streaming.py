@@ -0,0 +1,160 @@
+import asyncio, codecs, csv, io, json
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+
+class IncrementalCsvParser:
+    def __init__(self, max_buffer: int = 16 * 1024 * 1024):
+        self.max_buffer = max_buffer
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._header: Optional[List[str]] = None
+
+    def _complete_prefix_end(self) -> int:
+        end = self._buffer.rfind("\n")
+        while end != -1 and self._buffer.count('"', 0, end) % 2:
+            end = self._buffer.rfind("\n", 0, end)
+        return end + 1
+
+    def _parse(self, text: str) -> List[dict]:
+        if not text.strip():
+            return []
+        if self._header is None:
+            reader = csv.DictReader(io.StringIO(text))
+            rows = list(reader)
+            self._header = reader.fieldnames
+            return rows
+        return list(csv.DictReader(io.StringIO(text), fieldnames=self._header))
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        self._buffer += self._decoder.decode(chunk)
+        end = self._complete_prefix_end()
+        if not end:
+            if len(self._buffer) > self.max_buffer:
+                raise ValueError(f"CSV row exceeds {self.max_buffer} bytes")
+            return []
+        text, self._buffer = self._buffer[:end], self._buffer[end:]
+        return self._parse(text)
+
+    def close(self) -> List[dict]:
+        text, self._buffer = self._buffer + self._decoder.decode(b"", final=True), ""
+        return self._parse(text)
+
+
+class IncrementalJsonParser:
+    SEPARATORS = " \t\r\n,[]"
+
+    def __init__(self, max_buffer: int = 16 * 1024 * 1024):
+        self.max_buffer = max_buffer
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+
+    def _parse(self) -> List[dict]:
+        records = []
+        pos, size = 0, len(self._buffer)
+        while True:
+            while pos < size and self._buffer[pos] in self.SEPARATORS:
+                pos += 1
+            if pos >= size:
+                break
+            try:
+                record, pos = self._json.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break
+            if not isinstance(record, dict):
+                raise ValueError(f"Expected a JSON object but got {type(record).__name__}")
+            records.append(record)
+        self._buffer = self._buffer[pos:]
+        if len(self._buffer) > self.max_buffer:
+            raise ValueError(f"JSON record exceeds {self.max_buffer} bytes")
+        return records
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        self._buffer += self._decoder.decode(chunk)
+        return self._parse()
+
+    def close(self) -> List[dict]:
+        self._buffer += self._decoder.decode(b"", final=True)
+        records = self._parse()
+        if self._buffer.strip(self.SEPARATORS):
+            raise ValueError(f"Malformed JSON near: {self._buffer[:80]!r}")
+        return records
+
+
+async def ingest_stream(
+    chunks: AsyncIterator[bytes],
+    parser,
+    apply_batch: Callable[[List[dict]], int],
+    progress: Dict[str, any],
+    batch_size: int = 1000,
+) -> Dict[str, any]:
+    batch = []
+
+    async def flush():
+        nonlocal batch
+        records, batch = batch, []
+        # the body is not read again until the batch is applied, so a slow
+        # consumer pushes back on the client through TCP flow control
+        progress["loaded"] += await asyncio.to_thread(apply_batch, records)
+        progress["records"] += len(records)
+        progress["batches"] += 1
+
+    async for chunk in chunks:
+        progress["received_bytes"] += len(chunk)
+        for record in parser.feed(chunk):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await flush()
+    batch.extend(parser.close())
+    if batch:
+        await flush()
+    return progress
+
+
+if __name__ == "__main__":
+    def feed_all(parser, data: bytes, chunk_size: int) -> List[dict]:
+        records = []
+        for i in range(0, len(data), chunk_size):
+            records.extend(parser.feed(data[i:i + chunk_size]))
+        return records + parser.close()
+
+    async def as_stream(data: bytes, chunk_size: int):
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    csv_text = 'device_id,device_name,note\n1,"Cam, ""front""","line one\nline two"\n2,Thermo-é,plain\n3,"",\n'
+    expected_rows = list(csv.DictReader(io.StringIO(csv_text)))
+    for chunk_size in (1, 2, 7, 1024):
+        assert feed_all(IncrementalCsvParser(), csv_text.encode(), chunk_size) == expected_rows
+    assert expected_rows[0]["note"] == "line one\nline two"
+    assert feed_all(IncrementalCsvParser(), b"device_id,note\n1,no trailing newline", 4) == [{"device_id": "1", "note": "no trailing newline"}]
+
+    records = [{"device_id": 1, "metric_data": {"temperature": "70"}}, {"device_id": 2, "name": "a, [b]\n{c}"}, {"device_id": 3}]
+    array_body = json.dumps(records, indent=2).encode()
+    ndjson_body = "\n".join(json.dumps(record) for record in records).encode() + b"\n"
+    for chunk_size in (1, 5, 4096):
+        assert feed_all(IncrementalJsonParser(), array_body, chunk_size) == records
+        assert feed_all(IncrementalJsonParser(), ndjson_body, chunk_size) == records
+
+    for parser, body, message in [
+        (IncrementalCsvParser(max_buffer=16), b'id,note\n1,"' + b"x" * 64, "CSV row exceeds 16 bytes"),
+        (IncrementalJsonParser(max_buffer=16), b'[{"note": "' + b"x" * 64, "JSON record exceeds 16 bytes"),
+        (IncrementalJsonParser(), b'[{"device_id": 1}, {"device_id": ', "Malformed JSON"),
+        (IncrementalJsonParser(), b"[1, 2]", "Expected a JSON object"),
+    ]:
+        try:
+            feed_all(parser, body, 8)
+            assert False, "expected ValueError"
+        except ValueError as e:
+            assert message in str(e)
+
+    # a malformed record fails the upload, but batches applied before it stay applied
+    applied, progress = [], {"received_bytes": 0, "records": 0, "loaded": 0, "batches": 0}
+    body = b"".join(json.dumps({"device_id": i}).encode() + b"\n" for i in range(5)) + b'{"device_id": '
+    try:
+        asyncio.run(ingest_stream(as_stream(body, 10), IncrementalJsonParser(), lambda batch: applied.extend(batch) or len(batch), progress, 2))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert applied == [{"device_id": i} for i in range(4)]
+    assert progress["loaded"] == progress["records"] == 4 and progress["batches"] == 2
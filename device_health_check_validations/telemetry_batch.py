@@ -0,0 +1,139 @@
+from typing import Callable, List
+import numpy as np
+
+ISO8601_LENGTH = 20
+ISO8601_SEPARATORS = {4: "-", 7: "-", 10: "T", 13: ":", 16: ":", 19: "Z"}
+ISO8601_DIGITS = [i for i in range(ISO8601_LENGTH) if i not in ISO8601_SEPARATORS]
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def _digits_to_int(digits: np.ndarray) -> np.ndarray:
+    value = np.zeros(len(digits), dtype=np.int64)
+    for column in range(digits.shape[1]):
+        value = value * 10 + digits[:, column]
+    return value
+
+
+def _parse_timestamps(timestamps: List[str]):
+    # same acceptance as re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z') + strptime,
+    # but over a (rows x 20) matrix of code points instead of one string at a time
+    prefixes = np.array([t if isinstance(t, str) else "" for t in timestamps], dtype=f"U{ISO8601_LENGTH}")
+    chars = prefixes.view(np.uint32).reshape(len(prefixes), ISO8601_LENGTH).astype(np.int64)
+    digits = chars[:, ISO8601_DIGITS] - ord("0")
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    for position, separator in ISO8601_SEPARATORS.items():
+        valid &= chars[:, position] == ord(separator)
+    digits = np.where(valid[:, None], digits, 0)
+
+    year, month, day = _digits_to_int(digits[:, 0:4]), _digits_to_int(digits[:, 4:6]), _digits_to_int(digits[:, 6:8])
+    hour, minute, second = _digits_to_int(digits[:, 8:10]), _digits_to_int(digits[:, 10:12]), _digits_to_int(digits[:, 12:14])
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = DAYS_IN_MONTH[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    valid &= (hour < 24) & (minute < 60) & (second < 60)
+    return valid, prefixes
+
+
+def format_timestamps(timestamps: List[str]):
+    valid, prefixes = _parse_timestamps(timestamps)
+    return valid, prefixes.astype("U10")
+
+
+def epoch_seconds(timestamps: List[str]):
+    valid, prefixes = _parse_timestamps(timestamps)
+    seconds = np.where(valid, prefixes.astype("U19"), "1970-01-01T00:00:00").astype("datetime64[s]")
+    return valid, seconds.astype(np.int64)
+
+
+def to_float(values: List) -> np.ndarray:
+    try:
+        return np.asarray(values).astype(np.float64)
+    except (TypeError, ValueError):
+        return np.array([_float_or_nan(value) for value in values], dtype=np.float64)
+
+
+def _float_or_nan(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def to_int(values: List):
+    # int() per value exactly as the scalar sanitizer does it (int(72.5) == 72,
+    # int("70") == 70); values int() rejects mark their row invalid instead of
+    # failing the whole batch
+    try:
+        return np.ones(len(values), dtype=bool), np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+    except (TypeError, ValueError, OverflowError):
+        valid, ints = np.ones(len(values), dtype=bool), np.zeros(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            try:
+                ints[i] = int(value)
+            except (TypeError, ValueError, OverflowError):
+                valid[i] = False
+        return valid, ints
+
+
+def convert_degrees(degrees_F: np.ndarray) -> np.ndarray:
+    return np.round((degrees_F - 32) * 5 / 9, 2)
+
+
+def normalize_pressure(pressure: np.ndarray) -> np.ndarray:
+    return np.round(pressure / 100, 2)
+
+
+def normalize_humidity(humidity: List) -> List[str]:
+    if all(type(value) is str for value in humidity):
+        return np.char.add(np.asarray(humidity, dtype=str), "%").tolist()
+    return [f"{value}%" for value in humidity]
+
+
+def concat_names(device_names: List, device_types: List[str]):
+    if all(type(name) is str for name in device_names):
+        return np.ones(len(device_names), dtype=bool), np.char.add(np.asarray(device_names, dtype=str), np.asarray(device_types, dtype=str)).tolist()
+    full_names = [name + device_type if isinstance(name, str) else None for name, device_type in zip(device_names, device_types)]
+    return np.array([name is not None for name in full_names], dtype=bool), full_names
+
+
+def health_scores(health_statuses: List[str], get_health_value: Callable[[str], int]) -> np.ndarray:
+    categories, codes = np.unique(np.asarray(health_statuses).astype(str), return_inverse=True)
+    code_table = np.array([get_health_value(category) for category in categories], dtype=np.int64)
+    return code_table[codes.reshape(-1)]
+
+
+def sanitize_batch(entries: List[dict], get_health_value: Callable[[str], int]) -> np.ndarray:
+    if not entries:
+        return np.zeros(0, dtype=bool)
+    valid, dates = format_timestamps([e["timestamp"] for e in entries])
+    rows = np.flatnonzero(valid)
+    kept = [entries[i] for i in rows]
+    if not kept:
+        return valid
+
+    metrics = [e["metric_data"] for e in kept]
+    valid_temperatures, temperatures = to_int([m["temperature"] for m in metrics])
+    valid_pressures, pressures = to_int([m["pressure"] for m in metrics])
+    valid_names, full_names = concat_names([e["device_name"] for e in kept], [e["device_type"] for e in kept])
+    converted = valid_temperatures & valid_pressures & valid_names
+    if not converted.all():
+        valid[rows[~converted]] = False
+        keep = np.flatnonzero(converted)
+        rows, kept, metrics = rows[keep], [kept[i] for i in keep], [metrics[i] for i in keep]
+        temperatures, pressures, full_names = temperatures[keep], pressures[keep], [full_names[i] for i in keep]
+    temperatures = convert_degrees(temperatures).tolist()
+    pressures = normalize_pressure(pressures).tolist()
+    humidities = normalize_humidity([m["humidity"] for m in metrics])
+    scores = health_scores([e["health_status"] for e in kept], get_health_value).tolist() if kept else []
+
+    for e, m, date, temperature, pressure, humidity, score, full_name in zip(
+        kept, metrics, dates[rows].tolist(), temperatures, pressures, humidities, scores, full_names
+    ):
+        e["timestamp"] = date
+        m["temperature"] = temperature
+        m["pressure"] = pressure
+        m["humidity"] = humidity
+        e["health_score"] = score
+        del e["health_status"]
+        e["device_full_name"] = full_name
+    return valid
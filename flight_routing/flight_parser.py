@@ -0,0 +1,44 @@
+import re
+from typing import Dict, Iterable, Iterator, NamedTuple, Tuple
+
+SEPARATORS = re.compile(r"[,\n]")
+READ_SIZE = 1 << 16
+
+
+class Leg(NamedTuple):
+    airline: str
+    cost: int
+
+
+def cheapest_leg(costs: Dict[str, int]) -> Leg:
+    # on a tie the airline listed last wins, as in the original string parser
+    airline = min(reversed(costs), key=costs.get)
+    return Leg(airline, costs[airline])
+
+
+def iter_flight_definitions(chunks: Iterable[str]) -> Iterator[str]:
+    # definitions are separated by commas or newlines and may be split across chunks
+    pending = ""
+    for chunk in chunks:
+        definitions = SEPARATORS.split(pending + chunk)
+        pending = definitions.pop()
+        for definition in definitions:
+            if definition.strip():
+                yield definition.strip()
+    if pending.strip():
+        yield pending.strip()
+
+
+def parse_flights(chunks: Iterable[str]) -> Iterator[Tuple[str, str, Leg]]:
+    # SOURCE:DESTINATION:AIRLINE:COST, skipping definitions without a whole-number cost
+    for definition in iter_flight_definitions(chunks):
+        fields = definition.split(":")
+        if len(fields) < 4 or not fields[3].isdigit():
+            continue
+        yield fields[0], fields[1], Leg(fields[2], int(fields[3]))
+
+
+def read_flight_file(filename: str, read_size: int = READ_SIZE) -> Iterator[str]:
+    with open(filename, 'r') as flight_file:
+        while chunk := flight_file.read(read_size):
+            yield chunk
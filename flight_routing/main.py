@@ -1,27 +1,129 @@
 
 from collections import defaultdict
-import heapq
-import re
-from typing import Dict, List, Optional, Tuple
+import os, re, tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+from flight_parser import Leg, cheapest_leg, parse_flights, read_flight_file
+from route_graph import RouteGraph, RouteTable, routes_in_pool
 
 class FlightRouter():
-    def __init__(self, flights: List):
+    def __init__(self, flights: List, use_route_table: bool = False):
+        self.use_route_table = use_route_table
         self.flights = flights
         self.flight_dict = self.create_flight_dict()
-    
-    def create_flight_dict(self) -> None:
+
+    @classmethod
+    def from_file(cls, filename: str, use_route_table: bool = False) -> "FlightRouter":
+        router = cls("", use_route_table)
+        router.load_flights(read_flight_file(filename))
+        return router
+
+    @property
+    def flight_dict(self) -> Dict[str, Dict[str, Leg]]:
+        return self._flight_dict
+
+    @flight_dict.setter
+    def flight_dict(self, flight_dict: Dict[str, Dict[str, Leg]]) -> None:
+        # every airline's leg is kept alongside the quoted (cheapest) one so that
+        # removing or repricing it can fall back to the next cheapest airline
+        parsed, self._parsed = getattr(self, "_parsed", None), None
+        if parsed and parsed[0] is flight_dict:
+            self._airline_costs = parsed[1]
+        else:
+            self._airline_costs = {
+                source: {destination: {leg[0]: int(leg[1])} for destination, leg in destinations.items()}
+                for source, destinations in flight_dict.items()
+            }
+        self._flight_dict = flight_dict
+        self._graph = None
+        self._route_table = None
+
+    @property
+    def graph(self) -> RouteGraph:
+        if self._graph is None:
+            self._graph = RouteGraph.from_flight_dict(self._flight_dict)
+        return self._graph
+
+    @property
+    def route_table(self) -> RouteTable:
+        if self._route_table is None:
+            self._route_table = RouteTable(self.graph)
+        return self._route_table
+
+    def _requote(self, source: str, destination: str) -> bool:
+        # re-derives the cheapest leg of source -> destination and patches the
+        # graph and route table only when it actually changed
+        costs = self._airline_costs.get(source, {}).get(destination)
+        current = self._flight_dict.get(source, {}).get(destination)
+        leg = cheapest_leg(costs) if costs else None
+        if leg == current:
+            return False
+        if leg is None:
+            del self._flight_dict[source][destination]
+        else:
+            self._flight_dict.setdefault(source, {})[destination] = leg
+        if self._graph is None:
+            return True
+        if leg is None:
+            old_cost = self._graph.remove_leg(source, destination)
+        else:
+            old_cost = self._graph.set_leg(source, destination, leg.cost)
+        if self._route_table is not None:
+            self._route_table.leg_changed(source, destination, old_cost, leg and leg.cost)
+        return True
+
+    @staticmethod
+    def _check_cost(cost: int) -> None:
+        # checked before anything is stored: a string would poison later comparisons
+        # and a negative cost breaks Dijkstra and the route table's repair
+        if type(cost) is not int or cost < 0:
+            raise ValueError(f"Flight cost must be a non-negative int, got {cost!r}")
+
+    def add_flight(self, source: str, destination: str, airline: str, cost: int) -> bool:
+        # an airline keeps its cheaper fare; returns whether the quoted leg changed
+        self._check_cost(cost)
+        costs = self._airline_costs.setdefault(source, {}).setdefault(destination, {})
+        if airline in costs and costs[airline] <= cost:
+            return False
+        costs[airline] = cost
+        return self._requote(source, destination)
+
+    def update_flight(self, source: str, destination: str, airline: str, cost: int) -> bool:
+        self._check_cost(cost)
+        self._airline_costs.setdefault(source, {}).setdefault(destination, {})[airline] = cost
+        return self._requote(source, destination)
+
+    def remove_flight(self, source: str, destination: str, airline: Optional[str] = None) -> bool:
+        # removes one airline's leg, or every leg between the two airports
+        costs = self._airline_costs.get(source, {}).get(destination)
+        if not costs or (airline is not None and airline not in costs):
+            return False
+        if airline is None:
+            costs.clear()
+        else:
+            del costs[airline]
+        if not costs:
+            del self._airline_costs[source][destination]
+        self._requote(source, destination)
+        return True
+
+    def load_flights(self, chunks: Iterable[str]) -> int:
+        loaded = 0
+        for source, destination, leg in parse_flights(chunks):
+            self.add_flight(source, destination, *leg)
+            loaded += 1
+        return loaded
+
+    def create_flight_dict(self, chunks: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Leg]]:
         flight_dict = defaultdict(dict)
-        for flight in self.flights.split(","):
-            flight_details: List = flight.split(":")
-            source = flight_details.pop(0)
-            destination = flight_details.pop(0)
-            
-            source_details = flight_dict[source]
-            cost = flight_details[1]
-            if destination in source_details and cost > source_details[destination][1]:
-                continue
-            if cost.isdigit():
-                source_details[destination] = flight_details
+        airline_costs = {}
+        for source, destination, leg in parse_flights([self.flights] if chunks is None else chunks):
+            costs = airline_costs.setdefault(source, {}).setdefault(destination, {})
+            if leg.airline not in costs or leg.cost < costs[leg.airline]:
+                costs[leg.airline] = leg.cost
+        for source, destinations in airline_costs.items():
+            for destination, costs in destinations.items():
+                flight_dict[source][destination] = cheapest_leg(costs)
+        self._parsed = (flight_dict, airline_costs)
         return flight_dict
         
     def find_cost_of_direct_flight(self, source: str, destination: str) -> Optional[int]:
@@ -33,37 +135,34 @@ class FlightRouter():
     def find_cost_of_indirect_flights(self, source: str, destination: str) -> Tuple[any]:
         if source == destination:
             return ([source], 0)
-        
-        queue = []
-        visited = [source]
-        for k, v in self.flight_dict[source].items():
-            heapq.heappush(queue, ([source, k], int(v[1])))
-            visited.append(k)
-        
-        min_cost = None
-        results = []
-        
-        while queue:
-            path, cost = heapq.heappop(queue)
-            source = path[-1]
-            visited.append(source)
-            
-            for dest, details in self.flight_dict[source].items():
-                if dest in visited:
-                    continue
-                
-                path.append(dest)
-                heapq.heappush(queue, (path, cost + int(details[1])))
-                if dest != destination:
-                    continue
-                
-                trip_cost = cost + int(details[1])
-                if min_cost == None or trip_cost <= min_cost: 
-                    min_cost = trip_cost
-                    results.append(path)
-                return (results, min_cost)
-            
-        return (results, None)
+        routes = self.route_table if self.use_route_table else self.graph
+        path, cost = routes.cheapest_route(source, destination)
+        return ([path], cost) if path else ([], None)
+
+    def quote_routes(self, pairs: List[Tuple[str, str]], workers: Optional[int] = None) -> List[Tuple[any]]:
+        # answers every (source, destination) pair like find_cost_of_indirect_flights,
+        # with one single-source search per distinct source
+        by_source = defaultdict(list)
+        for i, (source, destination) in enumerate(pairs):
+            if source != destination:
+                by_source[source].append(i)
+        groups = [(source, [pairs[i][1] for i in indexes]) for source, indexes in by_source.items()]
+
+        if workers and workers > 1 and len(groups) > 1:
+            routes = routes_in_pool(self.graph, groups, workers)
+        elif self.use_route_table:
+            routes = [
+                self.graph.routes_from(source, destinations, self.route_table.tree(self.graph.ids[source]) if source in self.graph.ids else None)
+                for source, destinations in groups
+            ]
+        else:
+            routes = [self.graph.routes_from(source, destinations) for source, destinations in groups]
+
+        results = [([source], 0) for source, _ in pairs]
+        for (source, _), source_routes in zip(groups, routes):
+            for i, (path, cost) in zip(by_source[source], source_routes):
+                results[i] = ([path], cost) if path else ([], None)
+        return results
 
     def strip_stopwords(self, input: str, stopwords: List[str]) -> str:
         res = ' '.join(i if i.lower() not in stopwords else '' for i in input.split(' ')).lower().strip()
@@ -107,6 +206,63 @@ if __name__ == "__main__":
     assert flight_router.find_cost_of_direct_flight('UK', 'US') == 2
     assert flight_router.find_cost_of_indirect_flights("UK","IN") == ([['UK', 'FR', 'IN']], 10)
     assert flight_router.find_cost_of_indirect_flights("US","FR") == ([['US', 'UK', 'FR']], 10)
+    assert flight_router.find_cost_of_indirect_flights("UK","US") == ([['UK', 'US']], 2)
+    assert flight_router.find_cost_of_indirect_flights("CA","CAN") == ([['CA', 'UK', 'FR', 'IN', 'CAN']], 24)
+
+    table_router = FlightRouter(flight_router.flights, use_route_table=True)
+    assert table_router.find_cost_of_indirect_flights("UK","IN") == ([['UK', 'FR', 'IN']], 10)
+    assert table_router.add_flight("UK", "IN", "Direct", 9)
+    assert not table_router.add_flight("UK", "IN", "Pricey", 30)
+    assert table_router.find_cost_of_indirect_flights("UK","AUS") == ([['UK', 'IN', 'AUS']], 20)
+    table_router.update_flight("UK", "IN", "Direct", 15)
+    assert table_router.find_cost_of_indirect_flights("UK","AUS") == ([['UK', 'FR', 'IN', 'AUS']], 21)
+    assert table_router.remove_flight("FR", "IN")
+    assert not table_router.remove_flight("FR", "IN")
+    assert table_router.find_cost_of_indirect_flights("UK","IN") == ([['UK', 'US', 'IN']], 14)
+    table_router.add_flight("CA", "MX", "AeroMexico", 3)
+    assert table_router.find_cost_of_indirect_flights("CA","MX") == ([['CA', 'MX']], 3)
+    assert table_router.find_cost_of_direct_flight("UK", "IN") == 15
+
+    pairs = [("UK", "AUS"), ("CA", "MX"), ("UK", "UK"), ("US", "FR"), ("UK", "IN"), ("MX", "UK"), ("Nowhere", "UK")]
+    expected_quotes = [table_router.find_cost_of_indirect_flights(*pair) for pair in pairs]
+    assert table_router.quote_routes(pairs) == expected_quotes
+    assert table_router.quote_routes(pairs, workers=2) == expected_quotes
+    assert FlightRouter(table_router.flights).quote_routes([]) == []
+
+    numeric_router = FlightRouter("UK:US:Cheap:9,UK:US:Dear:10,UK:FR:Jet1:x,UK:DE:Short")
+    assert numeric_router.flight_dict["UK"] == {"US": Leg("Cheap", 9)}
+    assert numeric_router.find_cost_of_direct_flight("UK", "US") == 9
+
+    chunks = (chunk for chunk in ["UK:US:FedEx:4\nUK:FR:Je", "t1:2,FR:IN:AirFrance:8,", "US:IN:AirIndia:12"])
+    assert list(parse_flights(["UK:US:Fed", "Ex:4,,UK:FR:Jet1:2\n"])) == [("UK", "US", Leg("FedEx", 4)), ("UK", "FR", Leg("Jet1", 2))]
+    stream_router = FlightRouter("", use_route_table=True)
+    assert stream_router.load_flights(chunks) == 4
+    assert stream_router.find_cost_of_indirect_flights("UK", "IN") == ([['UK', 'FR', 'IN']], 10)
+    assert stream_router.add_flight("FR", "IN", "Budget", 5)
+    assert not stream_router.add_flight("FR", "IN", "Budget", 7)
+    assert stream_router.find_cost_of_indirect_flights("UK", "IN") == ([['UK', 'FR', 'IN']], 7)
+    assert stream_router.remove_flight("FR", "IN", "Budget")
+    assert stream_router.flight_dict["FR"]["IN"] == Leg("AirFrance", 8)
+    assert stream_router.update_flight("FR", "IN", "AirFrance", 20)
+    assert stream_router.find_cost_of_indirect_flights("UK", "IN") == ([['UK', 'US', 'IN']], 16)
+    assert not stream_router.remove_flight("FR", "IN", "Budget")
+    assert stream_router.remove_flight("US", "IN")
+    assert stream_router.find_cost_of_indirect_flights("UK", "IN") == ([['UK', 'FR', 'IN']], 22)
+    for change, cost in [(stream_router.update_flight, -5), (stream_router.add_flight, "7"), (stream_router.add_flight, True)]:
+        try:
+            change("FR", "UK", "Y", cost)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    assert "UK" not in stream_router._airline_costs["FR"] and stream_router.add_flight("FR", "UK", "Y", 1)
+    assert stream_router.find_cost_of_indirect_flights("UK", "IN") == ([['UK', 'FR', 'IN']], 22)
+
+    with tempfile.NamedTemporaryFile('w', suffix=".txt", delete=False) as flight_file:
+        flight_file.write(flight_router.flights.replace(",", "\n"))
+    file_router = FlightRouter.from_file(flight_file.name)
+    os.remove(flight_file.name)
+    assert file_router.flight_dict == flight_router.flight_dict
+    assert file_router.find_cost_of_indirect_flights("CA", "CAN") == ([['CA', 'UK', 'FR', 'IN', 'CAN']], 24)
 
     stop_words_list = ["is", "a", "to", "the", "and"]
     assert flight_router.strip_stopwords('This is a test sentence to remove stop words', stop_words_list) == "this   test sentence  remove stop words"
@@ -0,0 +1,207 @@
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+UNREACHABLE = -1
+
+
+class RouteGraph():
+    # airports are interned to integer ids; each airport keeps two parallel
+    # arrays of destination ids and integer leg costs
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.targets: List[array] = []
+        self.costs: List[array] = []
+
+    @classmethod
+    def from_flight_dict(cls, flight_dict: Dict[str, Dict[str, List[str]]]) -> "RouteGraph":
+        graph = cls()
+        for source, destinations in flight_dict.items():
+            source_id = graph.airport_id(source)
+            for destination, details in destinations.items():
+                graph.targets[source_id].append(graph.airport_id(destination))
+                graph.costs[source_id].append(int(details[1]))
+        return graph
+
+    def airport_id(self, airport: str) -> int:
+        airport_id = self.ids.get(airport)
+        if airport_id is None:
+            airport_id = self.ids[airport] = len(self.names)
+            self.names.append(airport)
+            self.targets.append(array("l"))
+            self.costs.append(array("q"))
+        return airport_id
+
+    def leg_cost(self, source_id: int, target_id: int) -> Optional[int]:
+        try:
+            return self.costs[source_id][self.targets[source_id].index(target_id)]
+        except ValueError:
+            return None
+
+    def set_leg(self, source: str, destination: str, cost: int) -> Optional[int]:
+        # adds or reprices source -> destination, returning the previous cost
+        source_id, target_id = self.airport_id(source), self.airport_id(destination)
+        old_cost = self.leg_cost(source_id, target_id)
+        if old_cost is None:
+            self.targets[source_id].append(target_id)
+            self.costs[source_id].append(cost)
+        else:
+            self.costs[source_id][self.targets[source_id].index(target_id)] = cost
+        return old_cost
+
+    def remove_leg(self, source: str, destination: str) -> Optional[int]:
+        source_id, target_id = self.ids.get(source), self.ids.get(destination)
+        if source_id is None or target_id is None:
+            return None
+        old_cost = self.leg_cost(source_id, target_id)
+        if old_cost is not None:
+            position = self.targets[source_id].index(target_id)
+            del self.targets[source_id][position]
+            del self.costs[source_id][position]
+        return old_cost
+
+    def shortest_paths(self, source_id: int, target_ids: Optional[Set[int]] = None) -> Tuple[array, array]:
+        # Dijkstra from source_id; stops early once every id in target_ids is settled
+        dist = array("q", [UNREACHABLE]) * len(self.names)
+        pred = array("l", [UNREACHABLE]) * len(self.names)
+        dist[source_id] = 0
+        heap = [(0, source_id)]
+        settled = bytearray(len(self.names))
+        targets, costs = self.targets, self.costs
+        remaining = set(target_ids) if target_ids else None
+        while heap:
+            cost, airport = heapq.heappop(heap)
+            if settled[airport]:
+                continue
+            settled[airport] = 1
+            if remaining is not None and airport in remaining:
+                remaining.discard(airport)
+                if not remaining:
+                    break
+            for destination, leg_cost in zip(targets[airport], costs[airport]):
+                trip_cost = cost + leg_cost
+                if not settled[destination] and (dist[destination] == UNREACHABLE or trip_cost < dist[destination]):
+                    dist[destination] = trip_cost
+                    pred[destination] = airport
+                    heapq.heappush(heap, (trip_cost, destination))
+        return dist, pred
+
+    def path_to(self, pred: array, source_id: int, target_id: int) -> List[str]:
+        path = [target_id]
+        while path[-1] != source_id:
+            path.append(pred[path[-1]])
+        return [self.names[airport] for airport in reversed(path)]
+
+    def cheapest_route(self, source: str, destination: str) -> Tuple[Optional[List[str]], Optional[int]]:
+        source_id, target_id = self.ids.get(source), self.ids.get(destination)
+        if source_id is None or target_id is None:
+            return None, None
+        dist, pred = self.shortest_paths(source_id, {target_id})
+        if dist[target_id] == UNREACHABLE:
+            return None, None
+        return self.path_to(pred, source_id, target_id), dist[target_id]
+
+    def routes_from(self, source: str, destinations: Iterable[str], tree: Optional[Tuple[array, array]] = None) -> List[Tuple[Optional[List[str]], Optional[int]]]:
+        # one search answers every destination quoted from the same source
+        destinations = list(destinations)
+        source_id = self.ids.get(source)
+        target_ids = [self.ids.get(destination) for destination in destinations]
+        if source_id is None:
+            return [(None, None)] * len(destinations)
+        dist, pred = tree or self.shortest_paths(source_id, {t for t in target_ids if t is not None})
+        return [
+            (self.path_to(pred, source_id, t), dist[t]) if t is not None and dist[t] != UNREACHABLE else (None, None)
+            for t in target_ids
+        ]
+
+
+_worker_graph: Optional[RouteGraph] = None
+
+
+def _init_worker(graph: RouteGraph) -> None:
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _routes_from(source_and_destinations: Tuple[str, List[str]]):
+    return _worker_graph.routes_from(*source_and_destinations)
+
+
+def routes_in_pool(graph: RouteGraph, groups: List[Tuple[str, List[str]]], workers: int) -> List[List[Tuple[Optional[List[str]], Optional[int]]]]:
+    # the graph is shipped once per worker through the initializer, then each
+    # task is just a source and the destinations quoted from it
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(graph,)) as pool:
+        return list(pool.map(_routes_from, groups, chunksize=max(1, len(groups) // (workers * 4))))
+
+
+class RouteTable():
+    # single-source trees computed on first use and kept (up to max_trees, least
+    # recently used first out) so repeated quotes from a source are lookups
+    def __init__(self, graph: RouteGraph, max_trees: int = 1024):
+        self.graph = graph
+        self.max_trees = max_trees
+        self.trees: "OrderedDict[int, Tuple[array, array]]" = OrderedDict()
+
+    def _resized(self, tree: Tuple[array, array]) -> Tuple[array, array]:
+        dist, pred = tree
+        missing = len(self.graph.names) - len(dist)
+        if missing > 0:
+            dist.extend(array("q", [UNREACHABLE]) * missing)
+            pred.extend(array("l", [UNREACHABLE]) * missing)
+        return tree
+
+    def tree(self, source_id: int) -> Tuple[array, array]:
+        tree = self.trees.get(source_id)
+        if tree is None:
+            tree = self.trees[source_id] = self.graph.shortest_paths(source_id)
+            if len(self.trees) > self.max_trees:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(source_id)
+        return self._resized(tree)
+
+    def cheapest_route(self, source: str, destination: str) -> Tuple[Optional[List[str]], Optional[int]]:
+        source_id, target_id = self.graph.ids.get(source), self.graph.ids.get(destination)
+        if source_id is None or target_id is None:
+            return None, None
+        dist, pred = self.tree(source_id)
+        if dist[target_id] == UNREACHABLE:
+            return None, None
+        return self.graph.path_to(pred, source_id, target_id), dist[target_id]
+
+    def leg_changed(self, source: str, destination: str, old_cost: Optional[int], new_cost: Optional[int]) -> None:
+        source_id, target_id = self.graph.ids.get(source), self.graph.ids.get(destination)
+        if source_id is None or target_id is None or old_cost == new_cost:
+            return
+        if new_cost is None or (old_cost is not None and new_cost > old_cost):
+            # a dearer or removed leg only matters to trees that route over it
+            for tree_source in [s for s, (_, pred) in self.trees.items() if target_id < len(pred) and pred[target_id] == source_id]:
+                del self.trees[tree_source]
+            return
+        for tree_source in list(self.trees):
+            self._repair(self._resized(self.trees[tree_source]), source_id, target_id, new_cost)
+
+    def _repair(self, tree: Tuple[array, array], source_id: int, target_id: int, cost: int) -> None:
+        # a new or cheaper leg can only shorten paths, so push the improvement
+        # outwards from the leg's destination instead of recomputing the tree
+        dist, pred = tree
+        if dist[source_id] == UNREACHABLE:
+            return
+        trip_cost = dist[source_id] + cost
+        if dist[target_id] != UNREACHABLE and trip_cost >= dist[target_id]:
+            return
+        dist[target_id], pred[target_id] = trip_cost, source_id
+        heap = [(trip_cost, target_id)]
+        targets, costs = self.graph.targets, self.graph.costs
+        while heap:
+            cost_so_far, airport = heapq.heappop(heap)
+            if cost_so_far > dist[airport]:
+                continue
+            for destination, leg_cost in zip(targets[airport], costs[airport]):
+                trip_cost = cost_so_far + leg_cost
+                if dist[destination] == UNREACHABLE or trip_cost < dist[destination]:
+                    dist[destination], pred[destination] = trip_cost, airport
+                    heapq.heappush(heap, (trip_cost, destination))
@@ -1,10 +1,86 @@
-import copy
-from typing import List, Set, Tuple, Dict
+import json, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from functools import lru_cache
+from typing import Hashable, List, Optional, Set, Tuple, Dict
+
+CONTAINER_TYPES = (dict, list, set)
+
+class MergeStrategy(Enum):
+    KEEP = "keep"
+    REPLACE = "replace"
+    MERGE = "merge"
+    COLLECT = "collect"
+
+class MergePolicy():
+    # dicts merge key by key, lists concatenate, sets union; scalars (and any
+    # two values of different types) can only be kept, replaced or collected
+    # into [existing, incoming]
+    def __init__(self, dicts: MergeStrategy = MergeStrategy.MERGE, lists: MergeStrategy = MergeStrategy.KEEP,
+                 sets: MergeStrategy = MergeStrategy.KEEP, scalars: MergeStrategy = MergeStrategy.KEEP):
+        for name, strategy in (("dicts", dicts), ("lists", lists), ("sets", sets)):
+            if strategy == MergeStrategy.COLLECT:
+                raise ValueError(f"{strategy} is not a valid merge strategy for {name}")
+        if scalars == MergeStrategy.MERGE:
+            raise ValueError(f"{scalars} is not a valid merge strategy for scalars")
+        self.by_type = {dict: dicts, list: lists, set: sets}
+        self.scalars = scalars
+
+    def strategy(self, cur_v: any, new_v: any) -> MergeStrategy:
+        if type(cur_v) is not type(new_v):
+            return self.scalars
+        return self.by_type.get(type(cur_v), self.scalars)
+
+class KeyPath():
+    def __init__(self, key_path: str):
+        self.key_path = key_path
+        self.segments = tuple(key_path.split("."))
+        self.find = self._compile(self.segments)
+
+    def __call__(self, item) -> any:
+        return self.find(item)
+
+    # same walk as ParseJson.find_key_in_item: falsy values don't advance the
+    # walk, and the item itself is never returned as a match
+    @staticmethod
+    def _compile(segments: Tuple[str, ...]):
+        if len(segments) == 1:
+            segment = segments[0]
+            def find(item):
+                if type(item) is not dict: return None
+                val = item.get(segment, None)
+                return val if val and val != item else None
+            return find
+
+        def find(item):
+            found_val = item
+            for segment in segments:
+                if type(found_val) is not dict: return None
+                val = found_val.get(segment, None)
+                if val:
+                    found_val = val
+            return found_val if found_val is not item and found_val != item else None
+        return find
+
+@lru_cache(maxsize=1024)
+def compile_key_path(key_path: str) -> Optional[KeyPath]:
+    if not key_path or not str.strip(key_path, ' .'):
+        return None
+    return KeyPath(key_path)
 
 class ParseJson():  
-    def __init__(self, data):
-        self.data = data
+    def __init__(self, data, merge_policy: Optional[MergePolicy] = None):
+        self.merge_policy = merge_policy or MergePolicy()
+        # containers shared with callers (constructor data, merged-in items) are
+        # "borrowed" and get shallow-copied the first time a merge writes to them;
+        # each is held with the number of places in the document still sharing it
+        self._borrowed: Dict[int, Tuple[any, int]] = {}
+        self.data = dict(data)
+        for v in self.data.values():
+            self._borrow(v)
         self.result = {}
+        self.indexes: Dict[str, Dict[any, Dict[str, any]]] = {}
+        self._indexed_values: Dict[str, Dict[str, any]] = {}
         
     def find_key_in_item(self, item, key_path) -> Dict[str, any]:
         found_val = item
@@ -16,48 +92,228 @@ class ParseJson():
         return found_val if found_val != item else None
         
     def reorganize_by_key_path(self, key_path: str) -> Dict[str, any]:
-        if not key_path or not str.strip(key_path, ' .'):
+        accessor = compile_key_path(key_path)
+        if not accessor:
             return {}
-        key_path = key_path.split(".")
+        find, result = accessor.find, self.result
         for item in self.data.values():
-            key = self.find_key_in_item(item, key_path)
+            key = find(item)
             if not key: continue
-            cur_value_at_key = self.result.get(key, None)
+            cur_value_at_key = result.get(key, None)
             if not cur_value_at_key:
-                self.result[key] = item
+                result[key] = item
                 continue
             if not isinstance(cur_value_at_key, list):
-                self.result[key] = [cur_value_at_key, item]
+                result[key] = [cur_value_at_key, item]
+                continue
+            cur_value_at_key.append(item)
+        return result
+
+    def reorganize_by_key_paths(self, key_paths: List[str]) -> Dict[str, Dict[str, any]]:
+        results = {key_path: {} for key_path in key_paths}
+        accessors = [(compile_key_path(key_path), results[key_path]) for key_path in results]
+        finders = [(accessor.find, result) for accessor, result in accessors if accessor]
+        for item in self.data.values():
+            for find, result in finders:
+                key = find(item)
+                if not key: continue
+                cur_value_at_key = result.get(key, None)
+                if not cur_value_at_key:
+                    result[key] = item
+                    continue
+                if not isinstance(cur_value_at_key, list):
+                    result[key] = [cur_value_at_key, item]
+                    continue
+                cur_value_at_key.append(item)
+        return results
+
+    def add_index(self, key_path: str) -> Dict[any, Dict[str, any]]:
+        accessor = compile_key_path(key_path)
+        if not accessor:
+            return {}
+        if accessor.key_path not in self.indexes:
+            self.indexes[accessor.key_path] = {}
+            self._indexed_values[accessor.key_path] = {}
+            for top_key in self.data:
+                self._index_item(accessor, top_key)
+        return self.indexes[accessor.key_path]
+
+    def lookup(self, key_path: str, value: any) -> List[any]:
+        index = self.indexes.get(key_path)
+        if index is None:
+            return []
+        return list(index.get(value, {}).values())
+
+    def _index_item(self, accessor: KeyPath, top_key: str) -> None:
+        index, values = self.indexes[accessor.key_path], self._indexed_values[accessor.key_path]
+        old_value = values.pop(top_key, None)
+        if old_value is not None:
+            bucket = index[old_value]
+            del bucket[top_key]
+            if not bucket: del index[old_value]
+        item = self.data.get(top_key)
+        value = accessor.find(item)
+        # walks that stop on a dict or list (see find_key_in_item) can't be keys
+        if not value or not isinstance(value, Hashable): return
+        index.setdefault(value, {})[top_key] = item
+        values[top_key] = value
+
+    def _reindex(self, top_key: str) -> None:
+        for key_path in self.indexes:
+            self._index_item(compile_key_path(key_path), top_key)
+
+    def _borrow(self, obj: any) -> None:
+        if isinstance(obj, CONTAINER_TYPES):
+            _, refs = self._borrowed.get(id(obj), (obj, 0))
+            self._borrowed[id(obj)] = (obj, refs + 1)
+
+    def _release(self, obj: any) -> None:
+        # one place in the document stopped sharing obj
+        if id(obj) not in self._borrowed:
+            return
+        _, refs = self._borrowed.pop(id(obj))
+        if refs > 1:
+            self._borrowed[id(obj)] = (obj, refs - 1)
+
+    def _owned(self, parent: any, key: any) -> any:
+        original = parent[key]
+        if id(original) not in self._borrowed:
+            return original
+        self._release(original)
+        obj = original.copy()
+        # merges only ever write into dict values; list items are never written to
+        if isinstance(obj, dict):
+            for v in obj.values():
+                self._borrow(v)
+        parent[key] = obj
+        return obj
+
+    def _merge(self, stack: List[Tuple[dict, any, any]]) -> bool:
+        # iterative so document depth isn't bounded by the recursion limit;
+        # only the incoming values are walked, never the existing document.
+        # Returns whether a type conflict or COLLECT made the result depend on
+        # what was merged before (see load_ndjson_shards)
+        policy = self.merge_policy
+        order_dependent = False
+        while stack:
+            parent, k, new_v = stack.pop()
+            if k not in parent:
+                parent[k] = new_v
+                self._borrow(new_v)
+                continue
+            cur_v = parent[k]
+            strategy = policy.strategy(cur_v, new_v)
+            if strategy == MergeStrategy.COLLECT or type(cur_v) is not type(new_v):
+                order_dependent = True
+            if strategy == MergeStrategy.KEEP:
                 continue
-            self.result[key].append(item)
-        return self.result
-
-    def _add_to_object(self, new_obj: any, cur_obj: any) -> None:
-        if not isinstance(new_obj, dict): return
-        for k, new_v in new_obj.items():
-            if k in cur_obj:
-                cur_v = cur_obj[k]
-                cur_v_type = type(cur_v)
-                new_v_type = type(new_v)
-                if cur_v_type == new_v_type:
-                    if cur_v_type in [dict, set]:
-                        new_v.update(cur_v)
-                        self._add_to_object(new_v, cur_v)
-                    elif cur_v_type == list:
-                        new_v.extend(cur_v)
-                    else:
-                        new_v = [new_v, cur_v]
+            if strategy == MergeStrategy.REPLACE:
+                self._release(cur_v)
+                parent[k] = new_v
+                self._borrow(new_v)
+            elif strategy == MergeStrategy.COLLECT:
+                # items of the new list are never written to, so neither needs a borrow
+                self._release(cur_v)
+                parent[k] = [cur_v, new_v]
+            elif isinstance(cur_v, dict):
+                cur_v = self._owned(parent, k)
+                stack.extend((cur_v, child_k, child_v) for child_k, child_v in reversed(new_v.items()))
+            elif isinstance(cur_v, list):
+                self._owned(parent, k).extend(new_v)
             else:
-                cur_obj[k] = new_v
+                self._owned(parent, k).update(new_v)
+        return order_dependent
+
+    def _owners(self, obj: any) -> List[str]:
+        # top-level keys whose item is or contains obj (shared containers can sit under several)
+        owners = []
+        for top_key, item in self.data.items():
+            stack = [item]
+            while stack:
+                node = stack.pop()
+                if node is obj:
+                    owners.append(top_key)
+                    break
+                if isinstance(node, dict):
+                    stack.extend(node.values())
+                elif isinstance(node, list):
+                    stack.extend(node)
+        return owners
+
+    def _add_to_object(self, new_obj: any, cur_obj: any, top_key: Optional[str] = None) -> None:
+        # without top_key the items to reindex are looked up, which is only worth
+        # the walk over the document while there are indexes to keep current
+        if top_key is not None:
+            top_keys = [top_key]
+        elif not self.indexes:
+            top_keys = []
+        elif cur_obj is self.data:
+            top_keys = list(new_obj) if isinstance(new_obj, dict) else []
+        else:
+            top_keys = self._owners(cur_obj)
+        if isinstance(new_obj, dict):
+            self._merge([(cur_obj, k, new_v) for k, new_v in reversed(new_obj.items())])
+        for key in top_keys:
+            self._reindex(key)
         
     def add_to_data(self, items: Dict[str, any]) -> Dict[str, any]:
         for k, v in items.items():
-            if k in self.data:
-                self._add_to_object(v, self.data[k])
-                continue
-            self.data[k] = v
+            self._merge([(self.data, k, v)])
+            self._reindex(k)
         return self.data
 
+def _iter_ndjson(path: str):
+    with open(path) as shard:
+        for line in shard:
+            if line.strip():
+                yield json.loads(line)
+
+def _merge_shard(path: str, merge_policy: Optional[MergePolicy]) -> Tuple[Dict[str, any], Dict[str, List[any]]]:
+    # folds a shard into a partial document. A top-level key whose values hit a
+    # type conflict or COLLECT has lost history that merging after earlier shards
+    # would need, so it is left out and its values are returned for replay
+    parser = ParseJson({}, merge_policy)
+    replay: Dict[str, List[any]] = {}
+    for item in _iter_ndjson(path):
+        for k, v in item.items():
+            if k not in replay and parser._merge([(parser.data, k, v)]):
+                replay[k] = []
+    if replay:
+        for k in replay:
+            del parser.data[k]
+        for item in _iter_ndjson(path):
+            for k, v in item.items():
+                if k in replay:
+                    replay[k].append(v)
+    return parser.data, replay
+
+def _read_shard(path: str) -> List[Dict[str, any]]:
+    return list(_iter_ndjson(path))
+
+# Every shard is folded into a partial document in its own process, and the
+# partials are then merged into one document in shard order. Merging a shard's
+# partial gives the same result as merging its lines one by one unless one of its
+# keys hit a type conflict (which KEEP or REPLACE then resolves by discarding a
+# value) or COLLECT; those keys are replayed value by value instead. COLLECT
+# wraps whatever came before, so with a COLLECT scalar policy shards are parsed
+# in the pool but every line is merged in order.
+def load_ndjson_shards(paths: List[str], workers: Optional[int] = None, merge_policy: Optional[MergePolicy] = None) -> ParseJson:
+    parser = ParseJson({}, merge_policy)
+    if not paths:
+        return parser
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if parser.merge_policy.scalars == MergeStrategy.COLLECT:
+            for lines in pool.map(_read_shard, paths):
+                for line in lines:
+                    parser.add_to_data(line)
+            return parser
+        for partial, replay in pool.map(_merge_shard, paths, [merge_policy] * len(paths)):
+            parser.add_to_data(partial)
+            for k, values in replay.items():
+                for v in values:
+                    parser.add_to_data({k: v})
+    return parser
+
 class TestClass:
     def __init__(self):
         self.data1 = {
@@ -85,8 +341,8 @@ class TestClass:
             }
         }
 
-        self.default_json_parser = ParseJson(copy.deepcopy(self.data1))
-        self.json_parser_2 = ParseJson(copy.deepcopy(self.data2))
+        self.default_json_parser = ParseJson(self.data1)
+        self.json_parser_2 = ParseJson(self.data2)
 
         self.add_to_data2_res = {
             "point1": {
@@ -154,8 +410,7 @@ class TestClass:
 
         parser = self.default_json_parser
         new_item = {"hi": "hello"}
-        expected_data = copy.deepcopy(self.data1)
-        expected_data["hi"] = "hello"
+        expected_data = {**self.data1, "hi": "hello"}
         assert parser.add_to_data(new_item) == expected_data
 
         new_items = {
@@ -230,7 +485,7 @@ class TestClass:
         }
         assert parser.reorganize_by_key_path("d3.ed1") == expected
 
-        parser = ParseJson(copy.deepcopy(self.add_to_data2_res))
+        parser = ParseJson(self.add_to_data2_res)
         expected_nested = {
             3: {
                 "d1": "hello",
@@ -254,10 +509,188 @@ class TestClass:
         assert parser.reorganize_by_key_path(".") == {}
         assert parser.reorganize_by_key_path("nonexistent.key.path") == {}
 
+    def test_compile_key_path(self):
+        parser = self.default_json_parser
+        obj = self.data2["point1"]
+        assert compile_key_path("d3.ed1") is compile_key_path("d3.ed1")
+        assert compile_key_path("") is None
+        assert compile_key_path(" . ") is None
+        for key_path in ["d3.ed1", "d1", "d4", "d3.ed3.hi", "d4.d3.ed1", "d1.d2", "d3"]:
+            assert compile_key_path(key_path)(obj) == parser.find_key_in_item(obj, key_path.split("."))
+
+    def test_reorganize_by_key_paths(self):
+        data = {**self.add_to_data1_res, "point4": {"d1": "hello", "d3": {"ed1": 2, "ed3": {"hi": 3}}}}
+        key_paths = ["d3.ed1", "d1", "d2", "", "nonexistent.key.path"]
+        results = ParseJson(data).reorganize_by_key_paths(key_paths)
+        assert list(results) == key_paths
+        for key_path in key_paths:
+            assert results[key_path] == ParseJson(data).reorganize_by_key_path(key_path)
+        assert results["d1"]["hello"] == [data["point1"], data["point4"]]
+
+    def test_indexes(self):
+        parser = ParseJson(self.add_to_data1_res)
+        index = parser.add_index("d3.ed1")
+        assert parser.add_index("d3.ed1") is index
+        assert parser.add_index("") == {}
+        assert parser.lookup("d3.ed1", 1) == [parser.data["point1"], parser.data["point2"]]
+        assert parser.lookup("d3.ed1", 2) == [parser.data["point3"]]
+        assert parser.lookup("d3.ed1", 3) == []
+        assert parser.lookup("d1", "hello") == []
+
+        parser.add_index("d3.ed3.hi")
+        assert parser.lookup("d3.ed3.hi", 3) == []
+        parser.add_to_data({
+            "point3": {"d3": {"ed3": {"hi": 3}}},
+            "point4": {"d3": {"ed1": 2}}
+        })
+        assert parser.lookup("d3.ed3.hi", 3) == [parser.data["point3"]]
+        assert parser.lookup("d3.ed1", 2) == [parser.data["point3"], parser.data["point4"]]
+
+        rebuilt = ParseJson(parser.data)
+        rebuilt.add_index("d3.ed1")
+        rebuilt.add_index("d3.ed3.hi")
+        assert rebuilt.indexes == parser.indexes
+
+        # _add_to_object keeps indexes current without being told the top-level key
+        parser.add_index("d3.ed5")
+        parser._add_to_object({"ed5": 5}, parser.data["point4"]["d3"])
+        parser._add_to_object({"point5": {"d3": {"ed5": 5}}}, parser.data)
+        assert parser.lookup("d3.ed5", 5) == [parser.data["point4"], parser.data["point5"]]
+
+    def test_add_to_data_does_not_mutate_inputs(self):
+        data = {"point1": {"d1": "hello", "d3": {"ed1": 1, "ed3": {"hi": 3}}, "tags": ["a"]}}
+        batch1 = {"point1": {"d3": {"ed3": {"bye": 4}, "ed4": 220}, "tags": ["b"]}, "point2": {"d3": {"ed1": 2}}}
+        batch2 = {"point2": {"d3": {"ed2": "x"}}}
+        snapshots = [json.dumps(obj, sort_keys=True) for obj in (data, batch1, batch2)]
+
+        parser = ParseJson(data)
+        parser.add_to_data(batch1)
+        parser.add_to_data(batch2)
+        assert [json.dumps(obj, sort_keys=True) for obj in (data, batch1, batch2)] == snapshots
+        assert parser.data == {
+            "point1": {"d1": "hello", "d3": {"ed1": 1, "ed3": {"hi": 3, "bye": 4}, "ed4": 220}, "tags": ["a"]},
+            "point2": {"d3": {"ed1": 2, "ed2": "x"}}
+        }
+        assert parser.data["point1"]["tags"] is data["point1"]["tags"]
+
+    def test_copied_containers_are_released(self):
+        shared = {"ed1": 1}
+        data = {"point1": {"d3": shared}, "point2": {"d3": shared}}
+        parser = ParseJson(data)
+        parser.add_to_data({"point1": {"d3": {"ed2": 2}}})
+        # point1's copies no longer pin the originals; point2 is still borrowed
+        # and borrows d3 again when it gets copied
+        assert id(data["point1"]) not in parser._borrowed and id(shared) not in parser._borrowed
+        assert id(data["point2"]) in parser._borrowed
+        parser.add_to_data({"point2": {"d3": {"ed3": 3}}, "point3": {"a": shared, "b": shared}})
+        parser.add_to_data({"point3": {"a": {"ed4": 4}}})
+        assert id(shared) in parser._borrowed and parser._borrowed[id(shared)][1] == 1
+        parser.add_to_data({"point3": {"b": {"ed5": 5}}})
+        assert shared == {"ed1": 1} and not parser._borrowed
+        assert parser.data == {
+            "point1": {"d3": {"ed1": 1, "ed2": 2}}, "point2": {"d3": {"ed1": 1, "ed3": 3}},
+            "point3": {"a": {"ed1": 1, "ed4": 4}, "b": {"ed1": 1, "ed5": 5}}
+        }
+
+        # replaced or collected originals are released as well
+        for scalars in (MergeStrategy.REPLACE, MergeStrategy.COLLECT):
+            parser = ParseJson({"point1": {"d3": shared, "tags": ["a", {"x": 1}]}}, MergePolicy(scalars=scalars))
+            parser.add_to_data({"point1": {"d3": 5, "tags": 6}})
+            assert list(parser._borrowed) == [], (scalars, parser._borrowed)
+        assert parser.data == {"point1": {"d3": [shared, 5], "tags": [["a", {"x": 1}], 6]}}
+
+    def test_merge_policies(self):
+        data = {"point1": {"d1": "hello", "tags": ["a"], "ids": {1}, "d3": {"ed1": 1}}}
+        policy = MergePolicy(dicts=MergeStrategy.MERGE, lists=MergeStrategy.MERGE, sets=MergeStrategy.MERGE,
+                             scalars=MergeStrategy.COLLECT)
+        parser = ParseJson(data, policy)
+        parser.add_to_data({"point1": {"d1": "bye", "tags": ["b"], "ids": {2}, "d3": 5}})
+        assert parser.data == {"point1": {"d1": ["hello", "bye"], "tags": ["a", "b"], "ids": {1, 2}, "d3": [{"ed1": 1}, 5]}}
+        assert data == {"point1": {"d1": "hello", "tags": ["a"], "ids": {1}, "d3": {"ed1": 1}}}
+
+        parser = ParseJson(data, MergePolicy(scalars=MergeStrategy.REPLACE))
+        parser.add_to_data({"point1": {"d1": "bye"}})
+        assert parser.data["point1"]["d1"] == "bye"
+
+        try:
+            MergePolicy(lists=MergeStrategy.COLLECT)
+            assert False
+        except ValueError:
+            pass
+
+    def test_deep_merge(self):
+        depth = 5000
+        existing, incoming = {}, {}
+        cur_existing, cur_incoming = existing, incoming
+        for _ in range(depth):
+            cur_existing["n"], cur_incoming["n"] = {}, {}
+            cur_existing, cur_incoming = cur_existing["n"], cur_incoming["n"]
+        cur_incoming["leaf"] = 1
+        parser = ParseJson({"point1": existing})
+        parser.add_to_data({"point1": incoming})
+        node = parser.data["point1"]
+        for _ in range(depth):
+            node = node["n"]
+        assert node == {"leaf": 1}
+        assert cur_existing == {}
+
+    def _load_shards(self, shards: List[List[dict]], merge_policy: Optional[MergePolicy] = None) -> Tuple[ParseJson, ParseJson]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, lines in enumerate(shards):
+                paths.append(os.path.join(tmp_dir, f"shard{i}.ndjson"))
+                with open(paths[-1], "w") as shard:
+                    shard.write("\n".join(json.dumps(line) for line in lines) + "\n")
+            parser = load_ndjson_shards(paths, workers=2, merge_policy=merge_policy)
+
+        expected = ParseJson({}, merge_policy)
+        for lines in shards:
+            for line in lines:
+                expected.add_to_data(line)
+        return parser, expected
+
+    def test_load_ndjson_shards(self):
+        shards = [
+            [{"point1": {"d1": "hello", "d3": {"ed1": 1}}}, {"point2": {"d2": 5}}],
+            [{"point1": {"d1": "bye", "d3": {"ed2": "x"}}}],
+            [{"point3": {"d2": 100}}, {"point2": {"d3": {"ed1": 2}}}],
+            [{"point1": {"d3": {"ed3": {"hi": 3}}}}, {"point3": {"d2": 7}}],
+            [{"hi": "hello"}]
+        ]
+        parser, expected = self._load_shards(shards)
+        assert parser.data == expected.data
+        assert parser.data["point1"] == {"d1": "hello", "d3": {"ed1": 1, "ed2": "x", "ed3": {"hi": 3}}}
+        assert load_ndjson_shards([]).data == {}
+
+        # a type conflict inside a shard must not decide what later values merge into
+        conflict = [[{"x": {"a": 1}}], [{"x": 5}, {"x": {"b": 2}}]]
+        parser, expected = self._load_shards(conflict)
+        assert parser.data == expected.data == {"x": {"a": 1, "b": 2}}
+        parser, expected = self._load_shards(conflict, MergePolicy(scalars=MergeStrategy.REPLACE))
+        assert parser.data == expected.data == {"x": {"b": 2}}
+
+        import random
+        rng = random.Random(0)
+        values = [1, 2, "s", [1], [2], {"a": 1}, {"b": {"c": 1}}, {"b": 2}, {"a": [3]}, None]
+        for scalars in (MergeStrategy.KEEP, MergeStrategy.REPLACE, MergeStrategy.COLLECT):
+            policy = MergePolicy(lists=MergeStrategy.MERGE, scalars=scalars)
+            for _ in range(5):
+                shards = [[{f"k{rng.randrange(3)}": rng.choice(values)} for _ in range(rng.randrange(4))] for _ in range(4)]
+                parser, expected = self._load_shards(shards, policy)
+                assert parser.data == expected.data, (scalars, shards)
+
 if __name__ == "__main__":    
     test_class = TestClass()
     test_class.test_find_key_in_item()
     test_class.test_add_to_data()
     test_class.test_reorganize_by_key_path()
     test_class.test_invalid_key_paths()
+    test_class.test_compile_key_path()
+    test_class.test_reorganize_by_key_paths()
+    test_class.test_indexes()
+    test_class.test_add_to_data_does_not_mutate_inputs()
+    test_class.test_copied_containers_are_released()
+    test_class.test_merge_policies()
+    test_class.test_deep_merge()
+    test_class.test_load_ndjson_shards()
         
\ No newline at end of file
@@ -0,0 +1,63 @@
+import argparse, copy, json, random, time
+from typing import Dict, List
+from main import DataManager
+
+NAMES = ["Alice", "Bob", "Charlie", "Dave", "Eve", "Mallory"]
+CITIES = ["Springfield", "Chicago", "Madison", "Austin"]
+
+
+def generate_rows(count: int, seed: int = 0) -> List[Dict[str, any]]:
+    rng = random.Random(seed)
+    rows = []
+    for user_id in range(1, count + 1):
+        name = rng.choice(NAMES)
+        address = {
+            "street": f"{rng.randint(1, 999)} Main St",
+            "city": rng.choice(CITIES),
+            "state": "IL",
+            "zipcode": rng.choice([f"{rng.randint(10000, 99999)}", "invalid-zip"]),
+        }
+        rows.append({
+            "id": user_id,
+            "name": name,
+            "email": f"{name.lower()}{user_id}@example.com",
+            "age": rng.choice([str(rng.randint(1, 99)), "thirty", None, "200"]),
+            "registration_date": rng.choice(["2023-05-14", "2022-08-22", "invalid-date"]),
+            "address": rng.choice([address, address, None]),
+        })
+    return rows
+
+
+def run(rows: List[Dict[str, any]], fast_path: bool):
+    data_manager = DataManager(fast_path=fast_path)
+    rows = copy.deepcopy(rows)
+    start = time.perf_counter()
+    output = data_manager.validate_batch(rows)
+    elapsed = time.perf_counter() - start
+    flags = {
+        "users_with_invalid_address": data_manager.users_with_invalid_address,
+        "users_with_invalid_registration": data_manager.users_with_invalid_registration,
+        "users_with_invalid_emails": data_manager.users_with_invalid_emails,
+        "users_with_registration_fraud": data_manager.users_with_registration_fraud,
+    }
+    return output, flags, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rows/sec of the pydantic models and the fast-path validator")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, args.seed)
+    model_output, model_flags, model_elapsed = run(rows, fast_path=False)
+    fast_output, fast_flags, fast_elapsed = run(rows, fast_path=True)
+    assert fast_output == model_output, "fast path output differs from the pydantic models"
+    assert fast_flags == model_flags, "fast path flags differ from the pydantic models"
+
+    print(json.dumps({
+        "rows": args.rows,
+        "models_rows_per_sec": round(args.rows / model_elapsed),
+        "fast_path_rows_per_sec": round(args.rows / fast_elapsed),
+        "speedup": round(model_elapsed / fast_elapsed, 2),
+    }, indent=2))
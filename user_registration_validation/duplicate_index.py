@@ -0,0 +1,127 @@
+import hashlib, math, re, sqlite3, string
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+DUPLICATE_KINDS = ["email", "address", "identity"]
+PUNCTUATION = str.maketrans("", "", string.punctuation)
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email or "@" not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition("@")
+    local = local.split("+", 1)[0]
+    return f"{local}@{domain}" if local and domain else None
+
+
+def normalize_address(full_address: Optional[str]) -> Optional[str]:
+    if not full_address:
+        return None
+    return WHITESPACE.sub(" ", full_address.lower().translate(PUNCTUATION)).strip() or None
+
+
+def normalize_identity(name: Optional[str], age: int) -> Optional[str]:
+    # age 0 is what invalid/missing ages are coerced to, so it can't identify anyone
+    if not name or not age:
+        return None
+    return f"{WHITESPACE.sub(' ', name.strip().lower())}|{age}"
+
+
+def normalized_keys(row: dict) -> Dict[str, str]:
+    keys = {
+        "email": normalize_email(row.get("email")),
+        "address": normalize_address(row.get("full_address")),
+        "identity": normalize_identity(row.get("name"), row.get("age")),
+    }
+    return {kind: key for kind, key in keys.items() if key}
+
+
+def digest(kind: str, key: str) -> bytes:
+    return hashlib.blake2b(f"{kind}:{key}".encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: Optional[bytes] = None, hashes: Optional[int] = None):
+        size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+        self.size = len(self.bits) * 8
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+
+    def _positions(self, key_digest: bytes):
+        # double hashing over the two halves of the 128-bit digest
+        h1 = int.from_bytes(key_digest[:8], "little")
+        h2 = int.from_bytes(key_digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key_digest: bytes) -> None:
+        for position in self._positions(key_digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key_digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key_digest))
+
+
+class RegistrationIndex:
+    def __init__(self, filename: str = ":memory:", bloom_capacity: Optional[int] = 1_000_000, error_rate: float = 0.01):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS registration_keys (digest BLOB PRIMARY KEY, user_id TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS bloom_filter (bits BLOB NOT NULL, hashes INTEGER NOT NULL)")
+        self.connection.commit()
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.bloom = self._load_bloom()
+
+    def _load_bloom(self) -> Optional[BloomFilter]:
+        if not self.bloom_capacity:
+            return None
+        saved = self.connection.execute("SELECT bits, hashes FROM bloom_filter").fetchone()
+        if saved:
+            return BloomFilter(self.bloom_capacity, self.error_rate, *saved)
+        bloom = BloomFilter(self.bloom_capacity, self.error_rate)
+        for (key_digest,) in self.connection.execute("SELECT digest FROM registration_keys"):
+            bloom.add(key_digest)
+        return bloom
+
+    def _owner(self, key_digest: bytes) -> Optional[str]:
+        if self.bloom is not None and key_digest not in self.bloom:
+            return None
+        found = self.connection.execute("SELECT user_id FROM registration_keys WHERE digest = ?", (key_digest,)).fetchone()
+        return found[0] if found else None
+
+    def duplicates(self, row: dict) -> List[str]:
+        # a key only counts as duplicated when another user already holds it,
+        # so re-running the same export doesn't flag everyone against themselves
+        user_id = str(row["id"])
+        kinds = []
+        for kind, key in normalized_keys(row).items():
+            key_digest = digest(kind, key)
+            owner = self._owner(key_digest)
+            if owner is None:
+                self.connection.execute("INSERT INTO registration_keys VALUES (?, ?)", (key_digest, user_id))
+                if self.bloom is not None:
+                    self.bloom.add(key_digest)
+            elif owner != user_id:
+                kinds.append(kind)
+        return kinds
+
+    @contextmanager
+    def transaction(self):
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            self.bloom = self._load_bloom()
+            raise
+        if self.bloom is not None:
+            self.connection.execute("DELETE FROM bloom_filter")
+            self.connection.execute("INSERT INTO bloom_filter VALUES (?, ?)", (bytes(self.bloom.bits), self.bloom.hashes))
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM registration_keys").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
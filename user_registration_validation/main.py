@@ -1,14 +1,24 @@
 import re
 from fastapi.exceptions import ValidationException
-from pydantic import BaseModel, constr, model_validator, PrivateAttr
-from typing import Optional, TypeAlias, Dict
-import csv, json
+from pydantic import BaseModel, constr, model_validator, PrivateAttr, TypeAdapter, ValidationError
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeAlias, Dict
+from typing_extensions import NotRequired, TypedDict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+import csv, json, os
+from duplicate_index import RegistrationIndex
+from validation_cache import SCHEMA_VERSION, ValidationCache
 
 VALID_STR: TypeAlias = constr(min_length=2, max_length=36)
 VALID_ADDR: TypeAlias = constr(min_length=9, max_length=380)
 VALID_ZIP: TypeAlias = constr(pattern="\\d{5}")
 VALID_DATE: TypeAlias = constr(pattern="\\d{4}-\\d{2}-\\d{2}")
 FIELD_NAMES = ["id", "name", "email", "age", "full_address", 'is_email_invalid', "registration_date", "is_adult"]
+BATCH_SIZE = 1000
+OUTPUT_FILE = "output.csv"
+JSON_READ_SIZE = 64 * 1024
 
 
 
@@ -100,70 +110,524 @@ class User(BaseModel):
 
 
 
+ZIPCODE_REGEX = re.compile(r"^\d{5}$")
+REGISTRATION_DATE_REGEX = re.compile("(\\d{4}-\\d{2}-\\d{2})")
+ADDRESS_FIELDS = ("street", "city", "state", "zipcode")
+FALLBACK = object()
+
+
+class FlatRegistration(TypedDict):
+    id: int
+    name: NotRequired[VALID_STR]
+    email: VALID_STR
+    age: int
+    registration_date: VALID_DATE
+    street: NotRequired[VALID_STR]
+    city: NotRequired[VALID_STR]
+    state: NotRequired[VALID_STR]
+    zipcode: NotRequired[VALID_ZIP]
+
+
+FLAT_REGISTRATIONS = TypeAdapter(List[FlatRegistration])
+
+
+class FastValidator:
+    # Single-pass equivalent of Address -> RegistrationInfo -> User for the rows
+    # those models accept. Anything the models would reject or coerce in a way
+    # not mirrored here comes back as FALLBACK so DataManager can run the
+    # pydantic models on it and raise or flag exactly as before.
+    def flatten(self, data: dict):
+        if not isinstance(data, dict) or not {"id", "email", "age", "registration_date", "address"} <= data.keys():
+            return FALLBACK
+        if "is_email_invalid" in data:
+            return FALLBACK
+        flat = {"id": data["id"], "email": data["email"]}
+        if "name" in data:
+            flat["name"] = data["name"]
+
+        email = data["email"]
+        if not isinstance(email, str) or '@' not in email:
+            return FALLBACK
+
+        address = data["address"]
+        if isinstance(address, dict):
+            if not all(field in address for field in ADDRESS_FIELDS):
+                return FALLBACK
+            zipcode = address["zipcode"]
+            if not isinstance(zipcode, str) or not zipcode:
+                return FALLBACK
+            flat.update((field, address[field]) for field in ADDRESS_FIELDS)
+            if not ZIPCODE_REGEX.fullmatch(zipcode):
+                flat["zipcode"] = "00000"
+
+        age = data["age"]
+        if not age:
+            flat["age"] = 0
+        elif not isinstance(age, str) or not age.isascii():
+            return FALLBACK
+        else:
+            flat["age"] = int(age) if age.isdigit() and 1 <= int(age) < 150 else 0
+
+        registration_date = data["registration_date"]
+        if not isinstance(registration_date, str) or not registration_date or not registration_date.isascii():
+            return FALLBACK
+        match = REGISTRATION_DATE_REGEX.fullmatch(registration_date)
+        flat["registration_date"] = match[0] if match else "1900-01-01"
+        return flat
+
+    def validate(self, flats: List[dict]) -> List[Optional[dict]]:
+        # one pydantic-core call per batch; rows it rejects are retried through the models
+        results: List[Optional[dict]] = [None] * len(flats)
+        pending = [i for i, flat in enumerate(flats) if flat is not FALLBACK]
+        while pending:
+            try:
+                validated = FLAT_REGISTRATIONS.validate_python([flats[i] for i in pending])
+            except ValidationError as e:
+                rejected = {pending[error["loc"][0]] for error in e.errors()}
+                pending = [i for i in pending if i not in rejected]
+                continue
+            for i, row in zip(pending, validated):
+                results[i] = row
+            break
+        return results
+
+    def to_csv_row(self, row: dict) -> dict:
+        full_address = f"{row['street']}, {row['city']}, {row['state']}, {row['zipcode']}" if "street" in row else None
+        return {
+            "id": row["id"],
+            "name": row.get("name"),
+            "email": row["email"],
+            "age": row["age"],
+            "full_address": full_address,
+            "is_email_invalid": False,
+            "registration_date": row["registration_date"],
+            "is_adult": row["age"] != 0,
+        }
+
+
+def iter_json_array(json_file, read_size: int = JSON_READ_SIZE) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    buffer, pos, done = "", 0, False
+    while not done:
+        chunk = json_file.read(read_size)
+        done = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos == len(buffer):
+                break
+            try:
+                row, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if done:
+                    raise
+                break
+            yield row
+
+
+def _validate_chunk(rows: List[dict], fast_path: bool):
+    return DataManager(fast_path=fast_path)._validate_rows(rows)
+
+
+class InvalidUserSink:
+    def __init__(self, log: "InvalidUserLog", category: str):
+        self.log = log
+        self.category = category
+        self.count = 0
+
+    def append(self, user_id) -> None:
+        self.log.write(self.category, user_id)
+        self.count += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class InvalidUserLog:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = None
+        self._writer = None
+
+    @contextmanager
+    def open(self):
+        with open(self.filename, 'w', newline='') as log_file:
+            self._file, self._writer = log_file, csv.writer(log_file)
+            self._writer.writerow(["category", "user_id"])
+            try:
+                yield self
+            finally:
+                self._file = self._writer = None
+
+    def write(self, category: str, user_id) -> None:
+        if self._writer is None:
+            raise RuntimeError(f"{self.filename} is not open for writing")
+        self._writer.writerow([category, user_id])
+
+
 class DataManager():
-    def __init__(self):
-        self.users_with_invalid_address = []
-        self.users_with_invalid_registration = []
-        self.users_with_invalid_emails = []
-        self.users_with_registration_fraud = []
+    def __init__(self, fast_path: bool = True, invalid_users_file: Optional[str] = None,
+                 duplicate_index: Optional[RegistrationIndex] = None, validation_cache: Optional[ValidationCache] = None):
+        self.invalid_user_log = InvalidUserLog(invalid_users_file) if invalid_users_file else None
+        if self.invalid_user_log:
+            self.users_with_invalid_address = InvalidUserSink(self.invalid_user_log, "invalid_address")
+            self.users_with_invalid_registration = InvalidUserSink(self.invalid_user_log, "invalid_registration")
+            self.users_with_invalid_emails = InvalidUserSink(self.invalid_user_log, "invalid_email")
+            self.users_with_registration_fraud = InvalidUserSink(self.invalid_user_log, "registration_fraud")
+            self.users_with_duplicate_email = InvalidUserSink(self.invalid_user_log, "duplicate_email")
+            self.users_with_duplicate_address = InvalidUserSink(self.invalid_user_log, "duplicate_address")
+            self.users_with_duplicate_identity = InvalidUserSink(self.invalid_user_log, "duplicate_identity")
+        else:
+            self.users_with_invalid_address = []
+            self.users_with_invalid_registration = []
+            self.users_with_invalid_emails = []
+            self.users_with_registration_fraud = []
+            self.users_with_duplicate_email = []
+            self.users_with_duplicate_address = []
+            self.users_with_duplicate_identity = []
+        self.duplicate_index = duplicate_index
+        self.validation_cache = validation_cache
+        self.fast_path = fast_path
+        self.fast_validator = FastValidator()
 
-    def _validate_and_transform(self, data):
+    def _validate_row(self, data) -> Tuple[any, dict, List[str]]:
         user_id = data["id"]
+        flags = []
         
         try:
             full_address = Address(**data["address"]).create_full_address() if isinstance(data["address"], dict) else None
         except ValidationException as e:
             print(f"Error caught when formatting the address for user {user_id}: {e}")
             full_address = None
-        if not full_address: self.users_with_invalid_address.append(user_id)
+        if not full_address: flags.append("users_with_invalid_address")
         
         try:
             reg_info = RegistrationInfo(registration_age=data["age"], registration_date=data["registration_date"]) 
         except ValidationException as e:
             print(f"Error caught when formatting the registration information for user {user_id}: {e}")
             reg_info = RegistrationInfo(_is_reg_age_invalid=True, _is_reg_date_invalid=True)
-        if reg_info._is_reg_age_invalid: self.users_with_registration_fraud.append(user_id)
-        if reg_info._is_reg_date_invalid: self.users_with_invalid_registration.append(user_id)
+        if reg_info._is_reg_age_invalid: flags.append("users_with_registration_fraud")
+        if reg_info._is_reg_date_invalid: flags.append("users_with_invalid_registration")
         
         data["age"] = reg_info.registration_age
         del data["address"]
         data["full_address"] = full_address
         data["registration_info"] = reg_info
-        return User(**data).get_csv_output()
+        return user_id, User(**data).get_csv_output(), flags
+
+    def _apply_flags(self, user_id, flags: List[str]):
+        for name in flags:
+            getattr(self, name).append(user_id)
+
+    def _validate_and_transform(self, data):
+        user_id, output, flags = self._validate_row(data)
+        self._apply_flags(user_id, flags)
+        return output
+
+    def _validate_rows(self, rows: List[dict]) -> List[Tuple[any, dict, List[str]]]:
+        if not self.fast_path:
+            return [self._validate_row(row) for row in rows]
+        validated = self.fast_validator.validate([self.fast_validator.flatten(row) for row in rows])
+        results = []
+        for data, row in zip(rows, validated):
+            if row is None:
+                results.append(self._validate_row(data))
+                continue
+            flags = [] if "street" in row else ["users_with_invalid_address"]
+            # RegistrationInfo's private flags default to a truthy tuple, so the
+            # models put every user on both lists; kept as-is to match their output
+            flags += ["users_with_registration_fraud", "users_with_invalid_registration"]
+            results.append((data["id"], self.fast_validator.to_csv_row(row), flags))
+        return results
 
-    def _write_to_json(self, rows):
+    def validate_batch(self, rows: List[dict]) -> List[dict]:
+        output = []
+        for user_id, row, flags in self._validate_rows(rows):
+            self._apply_flags(user_id, flags)
+            output.append(row)
+        return output
+
+    def _validate_in_batches(self, rows: Iterable[dict], workers: int = 1) -> Iterator[dict]:
+        rows = iter(rows)
+        batches = iter(lambda: list(islice(rows, BATCH_SIZE)), [])
+        if self.validation_cache is not None:
+            results = self._cached_batches(batches, workers)
+        else:
+            results = self._validated_batches(batches, workers)
+        for batch in results:
+            for user_id, row, flags in batch:
+                self._apply_flags(user_id, flags)
+                yield row
+
+    def _validated_batches(self, batches: Iterator[List[dict]], workers: int) -> Iterator[list]:
+        if workers <= 1:
+            for batch in batches:
+                yield self._validate_rows(batch)
+            return
+        # at most 2 chunks per worker are in flight, and chunks are drained in
+        # submission order so output.csv and the flag lists keep the input order
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                while len(pending) < workers * 2 and (batch := next(batches, None)) is not None:
+                    pending.append(pool.submit(_validate_chunk, batch, self.fast_path))
+                if not pending:
+                    break
+                yield pending.popleft().result()
+
+    def _cached_batches(self, batches: Iterator[List[dict]], workers: int) -> Iterator[list]:
+        # each batch is looked up in one query before anything is validated or
+        # dispatched; only the misses go through validation and get stored
+        lookups = deque()
+
+        def misses():
+            for batch in batches:
+                keys = [self.validation_cache.key(row) for row in batch]
+                cached = self.validation_cache.get_many(keys)
+                lookups.append((keys, cached))
+                yield [row for key, row in zip(keys, batch) if key not in cached]
+
+        for validated in self._validated_batches(misses(), workers):
+            keys, cached = lookups.popleft()
+            fresh = iter(validated)
+            results = [cached[key] if key in cached else next(fresh) for key in keys]
+            self.validation_cache.put_many((key, result) for key, result in zip(keys, results) if key not in cached)
+            yield results
+
+    def _flag_duplicates(self, rows: Iterable[dict]) -> Iterator[dict]:
+        # runs on validated output rows in the parent, after any worker pool,
+        # so the index sees every row exactly once and in input order
+        for row in rows:
+            for kind in self.duplicate_index.duplicates(row):
+                getattr(self, f"users_with_duplicate_{kind}").append(row["id"])
+            yield row
+
+    def _pipeline(self, rows: Iterable[dict], workers: int) -> Iterator[dict]:
+        rows = self._validate_in_batches(rows, workers)
+        return self._flag_duplicates(rows) if self.duplicate_index is not None else rows
+
+    def _write_to_json(self, rows: Iterable[dict]):
+        # rows is usually a lazy pipeline, so validation errors surface while
+        # writing; they propagate to the caller and output.csv is left untouched
+        tmp_file = f"{OUTPUT_FILE}.tmp"
         try:
-            with open("output.csv", 'w') as output_file:
+            with open(tmp_file, 'w') as output_file:
                 writer = csv.DictWriter(output_file, FIELD_NAMES)
                 writer.writeheader()
-                for row in rows:
-                    writer.writerow(row)
-        except Exception as e:
+                while chunk := list(islice(rows, BATCH_SIZE)):
+                    writer.writerows(chunk)
+                    output_file.flush()
+            os.replace(tmp_file, OUTPUT_FILE)
+        except OSError as e:
             print(f"Error writing to output.csv file: {e}")
-                
-    def load_and_write_csv(self, filename: str):
-        rows = []
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    @contextmanager
+    def _load_outputs(self):
+        # index keys and cached rows are only committed once the whole file went through
+        with self.invalid_user_log.open() if self.invalid_user_log else nullcontext(), \
+                self.duplicate_index.transaction() if self.duplicate_index is not None else nullcontext(), \
+                self.validation_cache.transaction() if self.validation_cache is not None else nullcontext():
+            yield
+
+    def load_and_write_csv(self, filename: str, workers: int = 1):
         try:
-            with open(filename, 'r') as csv_file:
-                for row in csv.DictReader(csv_file):
-                    rows.append(self._validate_and_transform(row))
-            self._write_to_json(rows)
+            with open(filename, 'r') as csv_file, self._load_outputs():
+                self._write_to_json(self._pipeline(csv.DictReader(csv_file), workers))
         except Exception as e:
             print(f"failure reading from json file {filename} and writing to output.csv")
     
-    def load_and_write_json(self, filename: str):
-        rows = []
+    def load_and_write_json(self, filename: str, workers: int = 1):
         try:
-            with open(filename, 'r') as json_file:
-                for row in json.load(json_file):
-                    res = self._validate_and_transform(row)
-                    rows.append(res)
-            self._write_to_json(rows)
+            with open(filename, 'r') as json_file, self._load_outputs():
+                self._write_to_json(self._pipeline(iter_json_array(json_file), workers))
         except Exception as e:
             print(f"failure reading from json file {filename} and writing to output.csv")
 
 
+class TestClass:
+    def __init__(self):
+        with open("sample_jsons.json", 'r') as json_file:
+            self.sample_rows = json.load(json_file)
+
+    @contextmanager
+    def _in_tmp_dir(self):
+        import tempfile
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                yield tmp_dir
+            finally:
+                os.chdir(cwd)
+
+    def _write_json(self, filename: str, rows: List[dict]) -> None:
+        with open(filename, 'w') as json_file:
+            json.dump(rows, json_file)
+
+    def _write_broken_json(self, filename: str, rows: List[dict]) -> None:
+        # the trailing row is missing fields the models require, so the load fails after rows were written
+        self._write_json(filename, rows + [{"id": 9, "email": "x@y.z"}])
+
+    def _read_output(self) -> List[dict]:
+        with open(OUTPUT_FILE, 'r') as output_file:
+            return list(csv.DictReader(output_file))
+
+    def test_iter_json_array(self):
+        import io
+        rows = self.sample_rows + [{"id": 5, "name": "Eve [admin]", "email": "e,ve@x.com", "tags": [[1, 2], {"a": "]"}]}]
+        text = json.dumps(rows, indent=2)
+        for read_size in (1, 3, 17, JSON_READ_SIZE):
+            assert list(iter_json_array(io.StringIO(text), read_size)) == rows
+        assert list(iter_json_array(io.StringIO("[]"))) == []
+        try:
+            list(iter_json_array(io.StringIO('[{"id": 1}, {"id": '), 4))
+            assert False, "expected JSONDecodeError"
+        except json.JSONDecodeError:
+            pass
+
+    def test_failed_load_keeps_output(self):
+        with self._in_tmp_dir():
+            self._write_json("users.json", self.sample_rows)
+            DataManager().load_and_write_json("users.json")
+            expected = self._read_output()
+            assert [row["id"] for row in expected] == ["1", "2", "3", "4"]
+
+            # a row the models reject surfaces while writing; output.csv is left as it was
+            self._write_broken_json("broken.json", self.sample_rows * 600)
+            DataManager().load_and_write_json("broken.json")
+            assert self._read_output() == expected
+            assert sorted(os.listdir(".")) == ["broken.json", OUTPUT_FILE, "users.json"]
+
+    def test_invalid_user_log(self):
+        with self._in_tmp_dir():
+            self._write_json("users.json", self.sample_rows)
+            in_memory = DataManager()
+            in_memory.load_and_write_json("users.json")
+            data_manager = DataManager(invalid_users_file="invalid_users.csv")
+            data_manager.load_and_write_json("users.json")
+            with open("invalid_users.csv", 'r') as log_file:
+                logged = list(csv.reader(log_file))
+            assert logged[0] == ["category", "user_id"]
+            for attribute in vars(in_memory):
+                if attribute.startswith("users_with_"):
+                    sink = getattr(data_manager, attribute)
+                    expected = [str(user_id) for user_id in getattr(in_memory, attribute)]
+                    assert [user_id for category, user_id in logged[1:] if category == sink.category] == expected
+                    assert len(sink) == len(expected)
+            assert ["invalid_address", "3"] in logged
+            try:
+                data_manager.users_with_invalid_address.append(5)
+                assert False, "expected RuntimeError"
+            except RuntimeError:
+                pass
+
+    def _flags(self, data_manager: DataManager) -> Dict[str, list]:
+        return {name: list(value) for name, value in vars(data_manager).items() if name.startswith("users_with_")}
+
+    def test_worker_pool_matches_serial(self):
+        from benchmark import generate_rows
+        with self._in_tmp_dir():
+            self._write_json("users.json", generate_rows(2 * BATCH_SIZE + 500, seed=1))
+            serial = DataManager()
+            serial.load_and_write_json("users.json")
+            expected = self._read_output()
+            pooled = DataManager()
+            pooled.load_and_write_json("users.json", workers=2)
+            assert self._read_output() == expected and len(expected) == 2 * BATCH_SIZE + 500
+            assert self._flags(pooled) == self._flags(serial)
+            assert any(self._flags(serial).values())
+
+    def test_duplicate_index(self):
+        alice_again = {
+            "id": 5, "name": " ALICE ", "email": "Alice+promo@Example.com", "age": "25", "registration_date": "2023-05-14",
+            "address": {"street": "123 Main St.", "city": "springfield", "state": "IL", "zipcode": "62701"},
+        }
+        with self._in_tmp_dir():
+            self._write_json("users.json", self.sample_rows + [alice_again])
+            data_manager = DataManager(duplicate_index=RegistrationIndex("index.db"))
+            data_manager.load_and_write_json("users.json")
+            assert [row["id"] for row in self._read_output()] == ["1", "2", "3", "4", "5"]
+            assert data_manager.users_with_duplicate_email == [5]
+            assert data_manager.users_with_duplicate_address == [5]
+            assert data_manager.users_with_duplicate_identity == [5]
+            indexed = len(data_manager.duplicate_index)
+            data_manager.duplicate_index.close()
+
+            # keys persist across runs; re-loading the same users doesn't flag them against themselves
+            index = RegistrationIndex("index.db")
+            assert len(index) == indexed
+            data_manager = DataManager(duplicate_index=index)
+            data_manager.load_and_write_json("users.json")
+            assert data_manager.users_with_duplicate_email == [5] and len(index) == indexed
+
+            # a failed load leaves no keys behind
+            newcomer = dict(self.sample_rows[3], id=6, email="dave@example.org", name="Erin")
+            self._write_broken_json("broken.json", [newcomer])
+            data_manager = DataManager(duplicate_index=index)
+            data_manager.load_and_write_json("broken.json")
+            assert len(index) == indexed
+            self._write_json("newcomer.json", [newcomer])
+            data_manager.load_and_write_json("newcomer.json")
+            assert data_manager.users_with_duplicate_address == [6] and data_manager.users_with_duplicate_email == []
+            assert len(index) == indexed + 1
+            index.close()
+
+    def test_validation_cache(self):
+        from benchmark import generate_rows
+        rows = generate_rows(BATCH_SIZE + 200, seed=2)
+        with self._in_tmp_dir():
+            self._write_json("users.json", rows)
+            uncached = DataManager()
+            uncached.load_and_write_json("users.json")
+            expected = self._read_output()
+
+            cache = ValidationCache("cache.db")
+            data_manager = DataManager(validation_cache=cache)
+            data_manager.load_and_write_json("users.json")
+            assert self._read_output() == expected and self._flags(data_manager) == self._flags(uncached)
+            assert (cache.hits, cache.misses, len(cache)) == (0, len(rows), len(rows))
+            cache.close()
+
+            # a rerun is served from the cache with the same output and flags
+            cache = ValidationCache("cache.db")
+            data_manager = DataManager(validation_cache=cache)
+            data_manager.load_and_write_json("users.json", workers=2)
+            assert self._read_output() == expected and self._flags(data_manager) == self._flags(uncached)
+            assert (cache.hits, cache.misses) == (len(rows), 0)
+
+            # only the changed row misses
+            changed = [dict(row) for row in rows]
+            changed[7]["age"] = "41"
+            self._write_json("changed.json", changed)
+            cache.hits = cache.misses = 0
+            DataManager(validation_cache=cache).load_and_write_json("changed.json")
+            assert (cache.hits, cache.misses, len(cache)) == (len(rows) - 1, 1, len(rows) + 1)
+            assert self._read_output()[7]["age"] == "41"
+
+            # a failed load stores nothing, and a new schema version matches nothing
+            self._write_broken_json("broken.json", generate_rows(50, seed=3))
+            DataManager(validation_cache=cache).load_and_write_json("broken.json")
+            assert len(cache) == len(rows) + 1
+            cache.close()
+            cache = ValidationCache("cache.db", schema_version=SCHEMA_VERSION + 1)
+            DataManager(validation_cache=cache).load_and_write_json("users.json")
+            assert (cache.hits, cache.misses) == (0, len(rows)) and self._read_output() == expected
+            cache.close()
+
 if __name__ == "__main__":
     data_manager = DataManager()
     data_manager.load_and_write_json("sample_jsons.json")
+
+    test_class = TestClass()
+    test_class.test_iter_json_array()
+    test_class.test_failed_load_keeps_output()
+    test_class.test_invalid_user_log()
+    test_class.test_worker_pool_matches_serial()
+    test_class.test_duplicate_index()
+    test_class.test_validation_cache()
     
\ No newline at end of file
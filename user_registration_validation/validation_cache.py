@@ -0,0 +1,60 @@
+import hashlib, json, sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# bump whenever validation rules or the output row shape change so stale
+# entries stop matching instead of being served
+SCHEMA_VERSION = 1
+LOOKUP_CHUNK = 500
+
+Result = Tuple[any, dict, List[str]]
+
+
+class ValidationCache:
+    def __init__(self, filename: str = ":memory:", schema_version: int = SCHEMA_VERSION):
+        self.schema_version = schema_version
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS validated_rows (digest BLOB PRIMARY KEY, result TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, row: dict) -> bytes:
+        canonical = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(f"{self.schema_version}:{canonical}".encode(), digest_size=16).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, Result]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), LOOKUP_CHUNK):
+            chunk = unique[start:start + LOOKUP_CHUNK]
+            query = f"SELECT digest, result FROM validated_rows WHERE digest IN ({','.join('?' * len(chunk))})"
+            for digest, result in self.connection.execute(query, chunk):
+                user_id, output, flags = json.loads(result)
+                found[digest] = (user_id, output, flags)
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+        return found
+
+    def put_many(self, results: Iterable[Tuple[bytes, Result]]) -> None:
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO validated_rows VALUES (?, ?)",
+            ((key, json.dumps(result)) for key, result in results),
+        )
+
+    @contextmanager
+    def transaction(self):
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM validated_rows").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()